@@ -73,6 +73,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'django_extensions',
     'songs',
     'rest_framework',
@@ -94,7 +95,7 @@ MIDDLEWARE = [
 ]
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'songs.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -146,6 +147,16 @@ DATABASES = {
     )
 }
 
+# One cache shared by every gunicorn worker. Invalidation relies on bumping
+# version stamps (songs.caching), which a per-process cache would only apply
+# in the worker that handled the change.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL', 'redis://127.0.0.1:6379'),
+    }
+}
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
@@ -182,6 +193,49 @@ USE_TZ = True
 
 # Cache hymns API for 1 hour
 HYMN_CACHE_TIMEOUT = 60 * 60
+# Per-user launch payload for /api/me/bootstrap/
+BOOTSTRAP_CACHE_TIMEOUT = 30
+BOOTSTRAP_JOIN_REQUEST_LIMIT = 20
+# Authenticated users resolved from JWTs are cached this long
+AUTH_USER_CACHE_TIMEOUT = 60
+# Group discovery: per-user membership map and the shared public group list
+GROUP_MEMBERSHIP_CACHE_TIMEOUT = 5 * 60
+PUBLIC_GROUPS_CACHE_TIMEOUT = 60
+# Marketplace home category tree; invalidated on change, this only bounds memory
+CATEGORY_TREE_CACHE_TIMEOUT = 5 * 60
+# How long add_item holds stock for a cart, and the sweeper's delete batch size
+CART_RESERVATION_SECONDS = 15 * 60
+RESERVATION_SWEEP_BATCH_SIZE = 1000
+# Largest payload the seller bulk product and order edit endpoints accept
+BULK_EDIT_MAX_ROWS = 500
+# Digital track delivery (songs.downloads): signed URL lifetime, how long a
+# checked purchase is trusted, and when buffered download counts are written
+DOWNLOAD_URL_SECONDS = 10 * 60
+DOWNLOAD_ENTITLEMENT_CACHE_TIMEOUT = 60 * 60
+DOWNLOAD_COUNT_FLUSH_EVERY = 50
+DOWNLOAD_COUNT_FLUSH_SECONDS = 60
+# Rows fetched per round trip while streaming order exports
+EXPORT_CHUNK_SIZE = 2000
+# Live event thumbnails (songs.thumbnails): probe target, per-probe timeout,
+# pooled connections, background workers and how long answers are cached
+YOUTUBE_THUMBNAIL_BASE_URL = 'https://img.youtube.com/vi'
+THUMBNAIL_HTTP_TIMEOUT = 2
+THUMBNAIL_HTTP_POOL_SIZE = 4
+THUMBNAIL_MAX_WORKERS = 2
+THUMBNAIL_CACHE_TIMEOUT = 24 * 60 * 60
+# Cart badge counts are cached per user until their cart changes
+CART_BADGE_CACHE_TIMEOUT = 60 * 60
+# Product.price_normalized is expressed in this currency, see ExchangeRate
+BASE_CURRENCY = 'USD'
+# Exchange rates are re-read from the database at least this often, even if
+# the cache delete from load_exchange_rates is missed
+EXCHANGE_RATE_CACHE_TIMEOUT = 10 * 60
+# SalesRollup leaves orders younger than this for its next run, so checkouts
+# still committing when it reads are not skipped
+SALES_ROLLUP_SETTLE_SECONDS = 5 * 60
+# Concurrent Cloudinary uploads (songs.uploads): pool size and per-file timeout
+UPLOAD_MAX_WORKERS = 4
+UPLOAD_TIMEOUT = 60
 STATIC_URL = 'static/'
 
 
@@ -4,7 +4,10 @@ from .models import (
     SocialPost, PostLike, PostComment, PostSave, Notification,
     Church, Videostudio, Choir, Group, GroupMember, GroupJoinRequest,
     GroupPost, GroupPostAttachment, ProductCategory, Product, ProductImage,
-    Cart, CartItem, Order, OrderItem, ProductReview, Wishlist, LiveEvent
+    Cart, CartItem, Order, OrderItem, ProductReview, Wishlist, LiveEvent,
+    ChurchFacetCount, VideostudioService, ChoirMembership, ExchangeRate,
+    SellerDailySales, ProductDailySales, SalesRollup, ProductCategoryClosure,
+    StockReservation
 )
 
 # Register all models
@@ -37,4 +40,13 @@ admin.site.register(Order)
 admin.site.register(OrderItem)
 admin.site.register(ProductReview)
 admin.site.register(Wishlist)
-admin.site.register(LiveEvent)
\ No newline at end of file
+admin.site.register(LiveEvent)
+admin.site.register(ChurchFacetCount)
+admin.site.register(VideostudioService)
+admin.site.register(ChoirMembership)
+admin.site.register(ExchangeRate)
+admin.site.register(SellerDailySales)
+admin.site.register(ProductDailySales)
+admin.site.register(SalesRollup)
+admin.site.register(ProductCategoryClosure)
+admin.site.register(StockReservation)
\ No newline at end of file
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .caching import AUTH_USER_NAMESPACE, versioned_key
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the user from the cache instead of the
+    database. Entries are keyed by the user's version stamp, which is bumped
+    whenever the user or their profile is saved (password change,
+    deactivation, edits), so a stale user is never served past that point.
+    This holds across workers only because CACHES is shared (Redis), not
+    per-process.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return super().get_user(validated_token)
+
+        cache_key = versioned_key(AUTH_USER_NAMESPACE, user_id)
+        user = cache.get(cache_key)
+        if user is None:
+            user = super().get_user(validated_token)
+            cache.set(cache_key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+            return user
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        return user
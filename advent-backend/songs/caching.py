@@ -0,0 +1,44 @@
+"""Version-stamped cache keys.
+
+Cached entries are keyed by an object id plus a version stamp. Bumping the
+stamp orphans every entry cached under the old one, so callers never have to
+know which keys to delete; orphans simply expire with their TTL.
+"""
+import uuid
+
+from django.core.cache import cache
+
+# Users resolved by CachedJWTAuthentication
+AUTH_USER_NAMESPACE = 'auth_user'
+# Per-user group membership map, see GroupMember.memberships_for
+GROUP_MEMBERSHIP_NAMESPACE = 'group_memberships'
+# Shared serialized list of public groups
+PUBLIC_GROUPS_NAMESPACE = 'public_groups'
+# Per-user cart badge count, see Cart.badge_count
+CART_NAMESPACE = 'cart'
+# Shared nested product category tree, see ProductCategoryViewSet.tree
+CATEGORY_TREE_NAMESPACE = 'category_tree'
+# Per-user digital download entitlements, see songs.downloads
+DOWNLOADS_NAMESPACE = 'downloads'
+
+
+def _version_key(namespace, pk):
+    return f'{namespace}:version:{pk}'
+
+
+def get_version(namespace, pk):
+    key = _version_key(namespace, pk)
+    version = cache.get(key)
+    if version is None:
+        # A missing stamp (never set or evicted) must not resurrect old entries
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace, pk):
+    cache.set(_version_key(namespace, pk), uuid.uuid4().hex, None)
+
+
+def versioned_key(namespace, pk):
+    return f'{namespace}:{pk}:{get_version(namespace, pk)}'
@@ -0,0 +1,148 @@
+"""Delivery of purchased digital tracks.
+
+A buyer's entitlement to a product's track is checked against their order
+once and then cached per (user, product), so repeated download taps are
+answered from the cache. Each tap gets a freshly signed Cloudinary download
+URL that stops working after DOWNLOAD_URL_SECONDS. Revoking relies on the
+shared cache (CACHES), so a refund handled by one worker is seen by all.
+Download counts are buffered in memory and written to Track.downloads in
+batches, and whatever is still pending when the worker exits.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from cloudinary.utils import private_download_url
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, F, When
+
+from .caching import DOWNLOADS_NAMESPACE, bump_version, versioned_key
+from .models import Order, OrderItem, Track
+
+logger = logging.getLogger(__name__)
+
+
+def _entitlement_key(user_id, kind, pk):
+    return f'{versioned_key(DOWNLOADS_NAMESPACE, user_id)}:{kind}:{pk}'
+
+
+def order_downloads(user_id, order_id):
+    """
+    The downloadable items of one of the user's orders as a list of
+    entitlement dicts, or None if the user has no such order. Raises
+    PermissionError for cancelled or refunded orders.
+    """
+    product_ids = cache.get(_entitlement_key(user_id, 'order', order_id))
+    if product_ids is not None:
+        entitlements = cache.get_many([_entitlement_key(user_id, 'product', pk) for pk in product_ids])
+        if len(entitlements) == len(product_ids):
+            return [entitlements[_entitlement_key(user_id, 'product', pk)] for pk in product_ids]
+
+    order_status = Order.objects.filter(pk=order_id, buyer_id=user_id).values_list('status', flat=True).first()
+    if order_status is None:
+        return None
+    if order_status in Order.NOT_SALES_STATUSES:
+        raise PermissionError(order_status)
+
+    items = OrderItem.objects.filter(
+        order_id=order_id, product__is_digital=True, product__track__isnull=False
+    ).select_related('product__track').order_by('id')
+    entitlements = {}
+    for item in items:
+        track = item.product.track
+        if not track.audio_file or item.product_id in entitlements:
+            continue
+        entitlements[item.product_id] = {
+            'product_id': item.product_id,
+            'title': item.product.title,
+            'track_id': track.id,
+            'public_id': track.audio_file.public_id,
+            'format': track.audio_file.format,
+            'resource_type': track.audio_file.resource_type,
+            'type': track.audio_file.type,
+        }
+
+    timeout = settings.DOWNLOAD_ENTITLEMENT_CACHE_TIMEOUT
+    cache.set_many(
+        {_entitlement_key(user_id, 'product', pk): entitlement for pk, entitlement in entitlements.items()},
+        timeout
+    )
+    cache.set(_entitlement_key(user_id, 'order', order_id), list(entitlements), timeout)
+    return list(entitlements.values())
+
+
+def revoke_downloads(user_id):
+    """Forget every cached entitlement of user_id, e.g. after a refund"""
+    bump_version(DOWNLOADS_NAMESPACE, user_id)
+
+
+def signed_download_url(entitlement):
+    """A signed Cloudinary download URL for the entitled track and its expiry timestamp"""
+    expires_at = int(time.time()) + settings.DOWNLOAD_URL_SECONDS
+    url = private_download_url(
+        entitlement['public_id'],
+        entitlement['format'],
+        resource_type=entitlement['resource_type'],
+        type=entitlement['type'],
+        expires_at=expires_at,
+        attachment=True,
+    )
+    return url, expires_at
+
+
+class BufferedCounter:
+    """
+    Per-process counter that adds to model.<field> in one UPDATE once
+    flush_every increments or flush_seconds have accumulated, and once more
+    when the process exits. Only counts pending when a worker is killed
+    outright are lost, which is fine for download tallies.
+    """
+
+    def __init__(self, model, field, flush_every, flush_seconds):
+        self.model = model
+        self.field = field
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        self._pending = {}
+        self._pending_total = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, pk, amount=1):
+        with self._lock:
+            self._pending[pk] = self._pending.get(pk, 0) + amount
+            self._pending_total += amount
+            due = (
+                self._pending_total >= self.flush_every
+                or time.monotonic() - self._last_flush >= self.flush_seconds
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending, self._pending_total = self._pending, {}, 0
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+        return self.model.objects.filter(pk__in=pending).update(**{self.field: Case(
+            *[When(pk=pk, then=F(self.field) + amount) for pk, amount in pending.items()],
+            default=F(self.field),
+            output_field=self.model._meta.get_field(self.field)
+        )})
+
+    def flush_at_exit(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Flushing buffered {self.model.__name__}.{self.field} counts failed: {str(e)}")
+
+
+track_downloads = BufferedCounter(
+    Track, 'downloads',
+    flush_every=settings.DOWNLOAD_COUNT_FLUSH_EVERY,
+    flush_seconds=settings.DOWNLOAD_COUNT_FLUSH_SECONDS,
+)
+atexit.register(track_downloads.flush_at_exit)
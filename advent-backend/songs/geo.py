@@ -0,0 +1,135 @@
+"""
+Plain-SQL "near me" search.
+
+Rows carry latitude, longitude and a geohash. A radius query first prunes
+candidates to the geohash cells covering the search circle (an indexed
+prefix match) and a latitude/longitude bounding box, then computes the
+haversine distance in SQL for the survivors only.
+"""
+import math
+
+from django.db.models import FloatField, Q
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+from rest_framework.exceptions import ValidationError
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+GEOHASH_PRECISION = 9
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+DEFAULT_RADIUS_KM = 25
+MAX_RADIUS_KM = 500
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    geohash = []
+    bits, bit_count, even = 0, 0, True
+    while len(geohash) < precision:
+        value, interval = (longitude, lng_range) if even else (latitude, lat_range)
+        mid = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_ALPHABET[bits])
+            bits, bit_count = 0, 0
+    return ''.join(geohash)
+
+
+def cell_size(precision):
+    """(height, width) of a geohash cell in degrees"""
+    lat_bits = (5 * precision) // 2
+    lng_bits = 5 * precision - lat_bits
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def covering_cells(latitude, longitude, radius_km):
+    """
+    Geohash prefixes whose union covers the search circle: the cell holding
+    the centre plus its eight neighbours, at the finest precision whose cells
+    are still at least radius_km across. None when the radius is too large
+    for prefix pruning to help.
+    """
+    # Cells are narrowest at the edge of the circle furthest from the equator
+    widest_lat = min(abs(latitude) + radius_km / KM_PER_DEGREE, 90)
+    lng_scale = max(math.cos(math.radians(widest_lat)), 1e-6)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        if height * KM_PER_DEGREE >= radius_km and width * KM_PER_DEGREE * lng_scale >= radius_km:
+            break
+    else:
+        return None
+    cells = set()
+    for dlat in (-height, 0, height):
+        for dlng in (-width, 0, width):
+            lat = latitude + dlat
+            if not -90 <= lat <= 90:
+                continue
+            lng = (longitude + dlng + 180) % 360 - 180
+            cells.add(encode_geohash(lat, lng, precision))
+    return cells
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """Q restricting latitude/longitude to the box around the search circle"""
+    dlat = radius_km / KM_PER_DEGREE
+    query = Q(latitude__gte=max(latitude - dlat, -90), latitude__lte=min(latitude + dlat, 90))
+    lng_scale = math.cos(math.radians(latitude))
+    if latitude + dlat >= 90 or latitude - dlat <= -90 or lng_scale <= 0:
+        return query
+    dlng = radius_km / (KM_PER_DEGREE * lng_scale)
+    if dlng >= 180:
+        return query
+    west, east = longitude - dlng, longitude + dlng
+    if west < -180:
+        return query & (Q(longitude__gte=west + 360) | Q(longitude__lte=east))
+    if east > 180:
+        return query & (Q(longitude__gte=west) | Q(longitude__lte=east - 360))
+    return query & Q(longitude__gte=west, longitude__lte=east)
+
+
+def haversine_km(latitude, longitude):
+    """SQL expression for the distance in km from the given point"""
+    lat1, lng1 = math.radians(latitude), math.radians(longitude)
+    half_dlat = (Radians('latitude') - lat1) / 2
+    half_dlng = (Radians('longitude') - lng1) / 2
+    a = Power(Sin(half_dlat), 2) + math.cos(lat1) * Cos(Radians('latitude')) * Power(Sin(half_dlng), 2)
+    return 2 * EARTH_RADIUS_KM * ASin(Sqrt(a), output_field=FloatField())
+
+
+def filter_near(queryset, latitude, longitude, radius_km):
+    """Rows within radius_km of the point, nearest first, annotated with distance"""
+    queryset = queryset.filter(bounding_box(latitude, longitude, radius_km))
+    cells = covering_cells(latitude, longitude, radius_km)
+    if cells:
+        prefix_match = Q()
+        for cell in cells:
+            prefix_match |= Q(geohash__startswith=cell)
+        queryset = queryset.filter(prefix_match)
+    return (
+        queryset.annotate(distance=haversine_km(latitude, longitude))
+        .filter(distance__lte=radius_km)
+        .order_by('distance')
+    )
+
+
+def apply_near_filter(request, queryset):
+    """Apply ?near=lat,lng&radius=km to queryset if present"""
+    near = request.query_params.get('near')
+    if not near:
+        return queryset
+    try:
+        latitude, longitude = (float(part) for part in near.split(','))
+        radius = float(request.query_params.get('radius', DEFAULT_RADIUS_KM))
+    except ValueError:
+        raise ValidationError({'near': 'Expected near=<latitude>,<longitude> and a numeric radius in km'})
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValidationError({'near': 'Latitude must be within ±90 and longitude within ±180'})
+    if not 0 < radius <= MAX_RADIUS_KM:
+        raise ValidationError({'radius': f'Radius must be between 0 and {MAX_RADIUS_KM} km'})
+    return filter_near(queryset, latitude, longitude, radius)
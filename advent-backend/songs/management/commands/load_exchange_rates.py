@@ -0,0 +1,57 @@
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from songs.models import CURRENCY_CHOICES, ExchangeRate
+
+
+class Command(BaseCommand):
+    help = (
+        "Load exchange rates from a local JSON ({\"base\": \"USD\", \"rates\": {\"KES\": 129.5}}) "
+        "or CSV (currency,units_per_base) file and re-normalize product prices"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Rates file; .json or .csv")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            with open(path, newline='') as rates_file:
+                if path.endswith('.json'):
+                    data = json.load(rates_file)
+                    base = data.get('base', settings.BASE_CURRENCY)
+                    raw_rates = data.get('rates', {})
+                else:
+                    base = settings.BASE_CURRENCY
+                    raw_rates = {row[0]: row[1] for row in csv.reader(rates_file) if row and not row[0].startswith('#')}
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read {path}: {e}")
+
+        if base != settings.BASE_CURRENCY:
+            raise CommandError(f"Rates must be quoted against {settings.BASE_CURRENCY}, not {base}")
+
+        known = dict(CURRENCY_CHOICES)
+        rates = {}
+        for currency, value in raw_rates.items():
+            currency = currency.strip().upper()
+            if currency not in known:
+                # Lets a CSV header row or extra currencies through harmlessly
+                self.stderr.write(f"Skipping unsupported currency {currency}")
+                continue
+            try:
+                rate = Decimal(str(value).strip())
+            except InvalidOperation:
+                raise CommandError(f"Invalid rate for {currency}: {value}")
+            if rate <= 0:
+                raise CommandError(f"Rate for {currency} must be positive")
+            rates[currency] = rate
+        rates[settings.BASE_CURRENCY] = Decimal(1)
+
+        updated = ExchangeRate.load(rates)
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {len(rates)} exchange rates and re-normalized {updated} product prices"
+        ))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from songs.models import ProductCategoryClosure
+
+
+class Command(BaseCommand):
+    help = "Recompute the product category closure table from ProductCategory.parent"
+
+    def handle(self, *args, **options):
+        ProductCategoryClosure.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {ProductCategoryClosure.objects.count()} category closure rows"
+        ))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from songs.models import ChurchFacetCount
+
+
+class Command(BaseCommand):
+    help = "Recompute the church directory facet counts from the Church table"
+
+    def handle(self, *args, **options):
+        ChurchFacetCount.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {ChurchFacetCount.objects.count()} church facet counters"
+        ))
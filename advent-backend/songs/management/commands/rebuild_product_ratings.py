@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from songs.models import Product
+
+
+class Command(BaseCommand):
+    help = "Recompute product rating aggregates from the ProductReview table"
+
+    def handle(self, *args, **options):
+        Product.rebuild_ratings()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt rating aggregates for {Product.objects.count()} products"
+        ))
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from songs.models import StockReservation
+
+
+class Command(BaseCommand):
+    help = "Delete expired cart stock reservations in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.RESERVATION_SWEEP_BATCH_SIZE,
+            help="Rows deleted per statement"
+        )
+
+    def handle(self, *args, **options):
+        released = StockReservation.release_expired(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Released {released} expired reservations"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from songs.models import LiveEvent
+from songs.thumbnails import update_event_thumbnail
+
+
+class Command(BaseCommand):
+    help = "Replace placeholder live event thumbnails with the best quality YouTube has"
+
+    def handle(self, *args, **options):
+        resolved = 0
+        for event in LiveEvent.objects.only('id', 'youtube_url', 'thumbnail').iterator():
+            if event.has_placeholder_thumbnail():
+                url = update_event_thumbnail(event.pk, LiveEvent.extract_youtube_id(event.youtube_url))
+                if url and url != event.thumbnail:
+                    resolved += 1
+        self.stdout.write(self.style.SUCCESS(f"Resolved {resolved} live event thumbnails"))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from songs.models import SalesRollup
+
+
+class Command(BaseCommand):
+    help = "Fold new orders into the daily seller and product sales rollups"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help="Recompute every rollup from the OrderItem table instead of only new orders"
+        )
+
+    def handle(self, *args, **options):
+        count = SalesRollup.run(rebuild=options['rebuild'])
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {count} orders"))
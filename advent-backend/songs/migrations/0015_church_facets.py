@@ -0,0 +1,62 @@
+# Generated by Django 5.2 on 2026-10-19 19:26
+
+from django.db import migrations, models
+
+
+HIERARCHY = ('continent', 'country', 'conference', 'district')
+
+
+def backfill_church_facets(apps, schema_editor):
+    Church = apps.get_model('songs', 'Church')
+    ChurchFacetCount = apps.get_model('songs', 'ChurchFacetCount')
+    rows = []
+    for index, level in enumerate(HIERARCHY):
+        fields = HIERARCHY[:index + 1]
+        queryset = Church.objects.all()
+        for field in fields:
+            queryset = queryset.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+        groups = queryset.order_by().values(*fields).annotate(total=models.Count('id'))
+        rows.extend(
+            ChurchFacetCount(level=level, count=group.pop('total'), **group)
+            for group in groups
+        )
+    ChurchFacetCount.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0014_alter_choir_cover_image_alter_choir_profile_image_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChurchFacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(choices=[('continent', 'Continent'), ('country', 'Country'), ('conference', 'Conference'), ('district', 'District')], max_length=20)),
+                ('continent', models.CharField(max_length=100)),
+                ('country', models.CharField(blank=True, default='', max_length=100)),
+                ('conference', models.CharField(blank=True, default='', max_length=200)),
+                ('district', models.CharField(blank=True, default='', max_length=200)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='church',
+            index=models.Index(fields=['continent', 'country', 'conference', 'district'], name='church_hierarchy_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='church',
+            index=models.Index(fields=['country', 'conference', 'district'], name='church_country_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='churchfacetcount',
+            index=models.Index(fields=['level', 'country', 'conference'], name='church_facet_country_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='churchfacetcount',
+            constraint=models.UniqueConstraint(fields=('level', 'continent', 'country', 'conference', 'district'), name='unique_church_facet'),
+        ),
+        migrations.RunPython(backfill_church_facets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2 on 2026-10-19 19:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_studio_services(apps, schema_editor):
+    Videostudio = apps.get_model('songs', 'Videostudio')
+    VideostudioService = apps.get_model('songs', 'VideostudioService')
+    rows = []
+    for studio_id, service_types in Videostudio.objects.values_list('id', 'service_types').iterator():
+        for service_type in set(service_types or []):
+            rows.append(VideostudioService(studio_id=studio_id, service_type=service_type))
+    VideostudioService.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0016_geolocation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VideostudioService',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service_type', models.CharField(choices=[('music_video', 'Music Video Production'), ('live_event', 'Live Event Coverage'), ('editing', 'Video Editing'), ('other', 'Other Video Services'), ('recording', 'Audio Recording'), ('mixing', 'Mixing & Mastering'), ('voice_over', 'Voice Over Recording'), ('podcast', 'Podcast Production'), ('documentary', 'Documentary Production')], max_length=20)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='videostudio',
+            index=models.Index(fields=['is_verified', 'service_rates'], name='videostudio_verified_rate_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='videostudio',
+            index=models.Index(fields=['service_rates'], name='videostudio_rate_idx'),
+        ),
+        migrations.AddField(
+            model_name='videostudioservice',
+            name='studio',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='services', to='songs.videostudio'),
+        ),
+        migrations.AddIndex(
+            model_name='videostudioservice',
+            index=models.Index(fields=['service_type', 'studio'], name='studio_service_type_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='videostudioservice',
+            constraint=models.UniqueConstraint(fields=('studio', 'service_type'), name='unique_studio_service'),
+        ),
+        migrations.RunPython(backfill_studio_services, migrations.RunPython.noop),
+    ]
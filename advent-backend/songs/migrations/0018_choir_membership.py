@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-19 19:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0017_videostudio_services'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChoirMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('joined_at', models.DateTimeField(auto_now_add=True)),
+                ('choir', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='songs.choir')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='choir_memberships', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='choir',
+            name='members',
+            field=models.ManyToManyField(blank=True, related_name='member_choirs', through='songs.ChoirMembership', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='choirmembership',
+            index=models.Index(fields=['user', 'choir'], name='choir_membership_user_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='choirmembership',
+            constraint=models.UniqueConstraint(fields=('choir', 'user'), name='unique_choir_membership'),
+        ),
+    ]
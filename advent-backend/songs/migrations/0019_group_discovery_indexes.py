@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-19 19:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0018_choir_membership'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='group',
+            index=models.Index(fields=['is_private', '-created_at'], name='group_public_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='group',
+            index=models.Index(fields=['creator', '-created_at'], name='group_creator_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='groupmember',
+            index=models.Index(fields=['user', 'group', 'is_admin'], name='group_member_user_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2 on 2026-10-19 19:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0019_group_discovery_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='groupmember',
+            name='last_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='grouppost',
+            index=models.Index(fields=['group', '-created_at'], name='group_post_feed_idx'),
+        ),
+    ]
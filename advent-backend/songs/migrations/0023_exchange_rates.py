@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-19 19:41
+
+import django.core.validators
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_base_currency_prices(apps, schema_editor):
+    # Other currencies are normalized once load_exchange_rates has run
+    Product = apps.get_model('songs', 'Product')
+    Product.objects.filter(currency=settings.BASE_CURRENCY).update(price_normalized=models.F('price'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0022_product_browse_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(choices=[('USD', 'US Dollar'), ('EUR', 'Euro'), ('GBP', 'British Pound'), ('KES', 'Kenyan Shilling'), ('NGN', 'Nigerian Naira')], max_length=3, unique=True)),
+                ('units_per_base', models.DecimalField(decimal_places=8, max_digits=18, validators=[django.core.validators.MinValueValidator(0)])),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='price_normalized',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=14, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_available', 'price_normalized'], name='product_available_norm_idx'),
+        ),
+        migrations.RunPython(backfill_base_currency_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2 on 2026-10-19 19:43
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def backfill_ratings(apps, schema_editor):
+    Product = apps.get_model('songs', 'Product')
+    ProductReview = apps.get_model('songs', 'ProductReview')
+    aggregates = {}
+    rows = ProductReview.objects.order_by().values_list('product_id', 'rating').annotate(n=models.Count('pk'))
+    for product_id, rating, n in rows:
+        fields = aggregates.setdefault(product_id, {'rating_sum': 0, 'rating_count': 0})
+        fields['rating_sum'] += rating * n
+        fields['rating_count'] += n
+        fields[f'rating_{rating}_count'] = n
+    for product_id, fields in aggregates.items():
+        fields['rating_average'] = (Decimal(fields['rating_sum']) / fields['rating_count']).quantize(Decimal('0.01'))
+        Product.objects.filter(pk=product_id).update(**fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0023_exchange_rates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_average',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_available', '-rating_average'], name='product_top_rated_idx'),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
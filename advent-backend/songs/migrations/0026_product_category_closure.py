@@ -0,0 +1,42 @@
+# Generated by Django 5.2 on 2026-10-19 19:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_closure(apps, schema_editor):
+    ProductCategory = apps.get_model('songs', 'ProductCategory')
+    ProductCategoryClosure = apps.get_model('songs', 'ProductCategoryClosure')
+    parents = dict(ProductCategory.objects.values_list('id', 'parent_id'))
+    rows = []
+    for category_id in parents:
+        ancestor_id, depth, seen = category_id, 0, set()
+        while ancestor_id and ancestor_id not in seen:
+            seen.add(ancestor_id)
+            rows.append(ProductCategoryClosure(ancestor_id=ancestor_id, descendant_id=category_id, depth=depth))
+            ancestor_id, depth = parents.get(ancestor_id), depth + 1
+    ProductCategoryClosure.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0025_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCategoryClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='songs.productcategory')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='songs.productcategory')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='category_closure_desc_idx')],
+                'constraints': [models.UniqueConstraint(fields=('ancestor', 'descendant'), name='unique_category_closure')],
+            },
+        ),
+        migrations.RunPython(build_closure, migrations.RunPython.noop),
+    ]
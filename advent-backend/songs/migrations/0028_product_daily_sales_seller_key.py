@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-19 19:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0027_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='productdailysales',
+            name='unique_product_daily_sales',
+        ),
+        migrations.AddConstraint(
+            model_name='productdailysales',
+            constraint=models.UniqueConstraint(fields=('product', 'seller', 'day', 'currency'), name='unique_product_daily_sales'),
+        ),
+    ]
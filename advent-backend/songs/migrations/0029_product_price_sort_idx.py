@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-19 20:36
+
+import django.db.models.functions.comparison
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0028_product_daily_sales_seller_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(models.F('is_available'), django.db.models.functions.comparison.Coalesce('price_normalized', models.Value(Decimal('999999999999.99')), output_field=models.DecimalField(decimal_places=2, max_digits=14)), models.F('id'), name='product_price_sort_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(models.F('is_available'), django.db.models.functions.comparison.Coalesce('price_normalized', models.Value(Decimal('-1')), output_field=models.DecimalField(decimal_places=2, max_digits=14)), models.F('id'), name='product_price_sort_desc_idx'),
+        ),
+    ]
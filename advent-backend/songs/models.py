@@ -1,15 +1,26 @@
 
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import Subquery
+from django.db.models.functions import Cast, Coalesce, Greatest, Now, NullIf, TruncDate
 from django.contrib.auth.models import AbstractUser, Group, Permission
-from django.utils.text import slugify
 from django.core.validators import FileExtensionValidator
 from django.core.exceptions import ValidationError
+from django.core.cache import cache
+from django.conf import settings
 from django.utils.translation import gettext_lazy as _
-from django.core.validators import MinValueValidator
+from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from urllib.parse import urlparse, parse_qs
+import os
 import re
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
 from cloudinary.models import CloudinaryField
+from .caching import AUTH_USER_NAMESPACE, CART_NAMESPACE, GROUP_MEMBERSHIP_NAMESPACE, bump_version, versioned_key
+from .geo import encode_geohash
+from .slugs import save_with_unique_slug
 
 
 # Custom User Model
@@ -38,6 +49,22 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Drop the cached copy used by CachedJWTAuthentication
+        bump_version(AUTH_USER_NAMESPACE, self.pk)
+
+    def delete(self, *args, **kwargs):
+        pk = self.pk
+        with transaction.atomic():
+            # Memberships cascade away without touching the counters they feed
+            Choir.objects.filter(memberships__user=self).update(
+                members_count=Greatest(models.F('members_count') - 1, 0)
+            )
+            result = super().delete(*args, **kwargs)
+        bump_version(AUTH_USER_NAMESPACE, pk)
+        return result
+
 
 # Track Model
 class Track(models.Model):
@@ -64,9 +91,7 @@ class Track(models.Model):
    
 
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = slugify(self.title)
-        super().save(*args, **kwargs)
+        save_with_unique_slug(self, self.title, super().save, *args, **kwargs)
 
     def __str__(self):
         return f'{self.title} - {self.artist.username}'
@@ -137,6 +162,10 @@ class Profile(models.Model):
     def __str__(self):
         return f'Profile of {self.user.username}'
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        bump_version(AUTH_USER_NAMESPACE, self.user_id)
+
 
 class SocialPost(models.Model):
     CONTENT_TYPES = (
@@ -228,7 +257,32 @@ class Notification(models.Model):
         return f"{self.sender.username} -> {self.recipient.username}: {self.message}"
 
 
-class Church(models.Model):
+class GeoLocatedModel(models.Model):
+    """Optional coordinates plus a geohash for indexed "near me" search"""
+    latitude = models.FloatField(
+        blank=True,
+        null=True,
+        validators=[MinValueValidator(-90), MaxValueValidator(90)]
+    )
+    longitude = models.FloatField(
+        blank=True,
+        null=True,
+        validators=[MinValueValidator(-180), MaxValueValidator(180)]
+    )
+    geohash = models.CharField(max_length=12, blank=True, default='', db_index=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = encode_geohash(self.latitude, self.longitude)
+        else:
+            self.geohash = ''
+        super().save(*args, **kwargs)
+
+
+class Church(GeoLocatedModel):
     name = models.CharField(max_length=200)
     continent = models.CharField(max_length=100)
     country = models.CharField(max_length=100)
@@ -245,14 +299,101 @@ class Church(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    HIERARCHY = ('continent', 'country', 'conference', 'district')
+
     def __str__(self):
         return self.name
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['continent', 'country', 'conference', 'district'], name='church_hierarchy_idx'),
+            models.Index(fields=['country', 'conference', 'district'], name='church_country_idx'),
+        ]
+
+    def hierarchy_paths(self):
+        """
+        (level, path) pairs this church is counted under, one per level of
+        the hierarchy, stopping at the first blank level
+        """
+        paths = []
+        path = {}
+        for level in self.HIERARCHY:
+            value = getattr(self, level)
+            if not value:
+                break
+            path[level] = value
+            paths.append((level, dict(path)))
+        return paths
+
+
+class ChurchFacetCount(models.Model):
+    """
+    Precomputed number of churches under each node of the
+    continent > country > conference > district hierarchy. Maintained
+    incrementally by the Church signal handlers in signals.py.
+    """
+    LEVEL_CHOICES = [(level, level.title()) for level in Church.HIERARCHY]
+
+    level = models.CharField(max_length=20, choices=LEVEL_CHOICES)
+    continent = models.CharField(max_length=100)
+    country = models.CharField(max_length=100, blank=True, default='')
+    conference = models.CharField(max_length=200, blank=True, default='')
+    district = models.CharField(max_length=200, blank=True, default='')
+    count = models.IntegerField(default=0)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['level', 'continent', 'country', 'conference', 'district'],
+                name='unique_church_facet'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['level', 'country', 'conference'], name='church_facet_country_idx'),
+        ]
 
-class Videostudio(models.Model):
+    def __str__(self):
+        return f"{self.level} {getattr(self, self.level)}: {self.count}"
+
+    @classmethod
+    def adjust(cls, level, path, delta):
+        """Add delta to the counter for path, creating the row if needed"""
+        lookup = {'level': level, **path}
+        updated = cls.objects.filter(**lookup).update(count=models.F('count') + delta)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    cls.objects.create(count=delta, **lookup)
+            except IntegrityError:
+                # Created concurrently; fall back to the increment
+                cls.objects.filter(**lookup).update(count=models.F('count') + delta)
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute every counter from the Church table"""
+        rows = []
+        for level_index, level in enumerate(Church.HIERARCHY):
+            fields = Church.HIERARCHY[:level_index + 1]
+            non_blank = models.Q()
+            for field in fields:
+                non_blank &= ~models.Q(**{field: ''}) & models.Q(**{f'{field}__isnull': False})
+            groups = (
+                Church.objects.filter(non_blank)
+                .order_by()
+                .values(*fields)
+                .annotate(total=models.Count('id'))
+            )
+            rows.extend(
+                cls(level=level, count=group.pop('total'), **group)
+                for group in groups
+            )
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(rows)
+
+
+class Videostudio(GeoLocatedModel):
     SERVICE_TYPES = (
         ('music_video', 'Music Video Production'),
         ('live_event', 'Live Event Coverage'),
@@ -316,14 +457,49 @@ class Videostudio(models.Model):
     def save(self, *args, **kwargs):
         """Ensure validation runs on every save"""
         self.full_clean()
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.sync_services()
+
+    def sync_services(self):
+        """Mirror service_types into the indexed VideostudioService table"""
+        wanted = set(self.service_types or [])
+        existing = set(self.services.values_list('service_type', flat=True))
+        if existing - wanted:
+            self.services.filter(service_type__in=existing - wanted).delete()
+        if wanted - existing:
+            VideostudioService.objects.bulk_create([
+                VideostudioService(studio=self, service_type=service_type)
+                for service_type in wanted - existing
+            ])
 
     class Meta:
         verbose_name = "Video Studio"
         verbose_name_plural = "Video Studios"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['is_verified', 'service_rates'], name='videostudio_verified_rate_idx'),
+            models.Index(fields=['service_rates'], name='videostudio_rate_idx'),
+        ]
+
+
+class VideostudioService(models.Model):
+    """One row per service a studio offers, so filtering by service is an index lookup"""
+    studio = models.ForeignKey(Videostudio, on_delete=models.CASCADE, related_name='services')
+    service_type = models.CharField(max_length=20, choices=Videostudio.SERVICE_TYPES)
 
-class Choir(models.Model):
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['studio', 'service_type'], name='unique_studio_service'),
+        ]
+        indexes = [
+            models.Index(fields=['service_type', 'studio'], name='studio_service_type_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.studio.name}: {self.service_type}"
+
+class Choir(GeoLocatedModel):
     GENRE_CHOICES = (
         ('gospel', 'Gospel'),
         ('contemporary', 'Contemporary Christian'),
@@ -339,6 +515,7 @@ class Choir(models.Model):
     contact_email = models.EmailField(blank=True, null=True)
     genre = models.CharField(max_length=50, choices=GENRE_CHOICES, default='gospel')
     members_count = models.PositiveIntegerField(default=0)
+    members = models.ManyToManyField(User, through='ChoirMembership', related_name='member_choirs', blank=True)
     # profile_image = models.ImageField(upload_to='choirs/profiles/', blank=True, null=True)
     # cover_image = models.ImageField(upload_to='choirs/covers/', blank=True, null=True)
     profile_image = CloudinaryField('image', folder='choirs/profiles/', blank=True, null=True)
@@ -357,6 +534,23 @@ class Choir(models.Model):
         verbose_name_plural = "Choirs"
         ordering = ['-created_at']
 
+
+class ChoirMembership(models.Model):
+    choir = models.ForeignKey(Choir, on_delete=models.CASCADE, related_name='memberships')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='choir_memberships')
+    joined_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['choir', 'user'], name='unique_choir_membership'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'choir'], name='choir_membership_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} in {self.choir.name}"
+
 class Group(models.Model):
     creator = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_groups')
     name = models.CharField(max_length=100)
@@ -369,15 +563,13 @@ class Group(models.Model):
     slug = models.SlugField(unique=True, max_length=100)
 
     def save(self, *args, **kwargs):
-        if not self.slug:
-            base_slug = slugify(self.name)
-            slug = base_slug
-            counter = 1
-            while Group.objects.filter(slug=slug).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            self.slug = slug
-        super().save(*args, **kwargs)
+        save_with_unique_slug(self, self.name, super().save, *args, **kwargs)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_private', '-created_at'], name='group_public_recent_idx'),
+            models.Index(fields=['creator', '-created_at'], name='group_creator_recent_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -387,13 +579,49 @@ class GroupMember(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='group_memberships')
     is_admin = models.BooleanField(default=False)
     joined_at = models.DateTimeField(auto_now_add=True)
+    last_read_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         unique_together = ('group', 'user')
+        indexes = [
+            models.Index(fields=['user', 'group', 'is_admin'], name='group_member_user_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} in {self.group.name}"
 
+    def unread_posts(self):
+        """Posts by other members since this member last read the feed (or joined)"""
+        return GroupPost.objects.filter(
+            group_id=self.group_id,
+            created_at__gt=self.last_read_at or self.joined_at
+        ).exclude(user_id=self.user_id)
+
+    @classmethod
+    def memberships_for(cls, user_id):
+        """
+        {group_id: {'is_member': bool, 'is_admin': bool}} for every group the
+        user belongs to or created, cached until their memberships change
+        """
+        cache_key = versioned_key(GROUP_MEMBERSHIP_NAMESPACE, user_id)
+        memberships = cache.get(cache_key)
+        if memberships is None:
+            rows = cls.objects.filter(user_id=user_id).order_by().values_list(
+                'group_id', 'is_admin', models.Value(True)
+            ).union(
+                Group.objects.filter(creator_id=user_id).order_by().values_list(
+                    'id', models.Value(False), models.Value(False)
+                ),
+                all=True
+            )
+            memberships = {}
+            for group_id, is_admin, is_member in rows:
+                flags = memberships.setdefault(group_id, {'is_member': False, 'is_admin': False})
+                flags['is_member'] |= is_member
+                flags['is_admin'] |= is_admin
+            cache.set(cache_key, memberships, settings.GROUP_MEMBERSHIP_CACHE_TIMEOUT)
+        return memberships
+
 class GroupJoinRequest(models.Model):
     STATUS_CHOICES = (
         ('pending', 'Pending'),
@@ -420,6 +648,12 @@ class GroupPost(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Feed cursor and unread counts both walk a group's posts by date
+            models.Index(fields=['group', '-created_at'], name='group_post_feed_idx'),
+        ]
+
     def __str__(self):
         return f"Post in {self.group.name} by {self.user.username}"
 
@@ -464,8 +698,155 @@ class ProductCategory(models.Model):
     def __str__(self):
         return self.name
 
+    def clean(self):
+        if self.pk and self.parent_id and self.subtree_contains(self.parent_id):
+            raise ValidationError({'parent': "A category cannot be moved under itself or its subcategories"})
+
+    def subtree_contains(self, category_id):
+        """Whether category_id is this category or one of its descendants"""
+        return ProductCategoryClosure.objects.filter(ancestor_id=self.pk, descendant_id=category_id).exists()
+
+class ProductCategoryClosure(models.Model):
+    """
+    Every (ancestor, descendant) pair of the category tree, each category
+    also paired with itself at depth 0, so a whole subtree is one indexed
+    lookup on ancestor. Maintained by the ProductCategory signal receivers.
+    """
+    ancestor = models.ForeignKey(ProductCategory, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(ProductCategory, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='unique_category_closure'),
+        ]
+        indexes = [
+            models.Index(fields=['descendant', 'depth'], name='category_closure_desc_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} > {self.descendant_id} ({self.depth})"
+
+    @classmethod
+    def subtree(cls, category_id):
+        """Ids of a category and all of its descendants, as a subquery"""
+        return cls.objects.filter(ancestor_id=category_id).values('descendant_id')
+
+    @classmethod
+    def attach(cls, category_id, parent_id):
+        """
+        Link category_id and everything below it under parent_id and each of
+        parent_id's ancestors. A new category also gets its depth 0 row.
+        """
+        subtree = list(cls.objects.filter(ancestor_id=category_id).values_list('descendant_id', 'depth'))
+        rows = []
+        if not subtree:
+            subtree = [(category_id, 0)]
+            rows.append(cls(ancestor_id=category_id, descendant_id=category_id, depth=0))
+        if parent_id:
+            above = cls.objects.filter(descendant_id=parent_id).values_list('ancestor_id', 'depth')
+            rows.extend(
+                cls(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=up + down + 1)
+                for ancestor_id, up in above
+                for descendant_id, down in subtree
+            )
+        cls.objects.bulk_create(rows)
+
+    @classmethod
+    def detach(cls, category_id):
+        """Unlink category_id and everything below it from the categories above it"""
+        cls.objects.filter(
+            descendant_id__in=cls.subtree(category_id)
+        ).exclude(
+            ancestor_id__in=cls.subtree(category_id)
+        ).delete()
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute every pair from ProductCategory.parent"""
+        parents = dict(ProductCategory.objects.values_list('id', 'parent_id'))
+        rows = []
+        for category_id in parents:
+            ancestor_id, depth, seen = category_id, 0, set()
+            # seen stops at a parent cycle left by older data
+            while ancestor_id and ancestor_id not in seen:
+                seen.add(ancestor_id)
+                rows.append(cls(ancestor_id=ancestor_id, descendant_id=category_id, depth=depth))
+                ancestor_id, depth = parents.get(ancestor_id), depth + 1
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(rows)
+
+CURRENCY_CHOICES = [
+    ('USD', 'US Dollar'),
+    ('EUR', 'Euro'),
+    ('GBP', 'British Pound'),
+    ('KES', 'Kenyan Shilling'),
+    ('NGN', 'Nigerian Naira')
+]
+
+class ExchangeRate(models.Model):
+    """How many units of a currency buy one unit of settings.BASE_CURRENCY"""
+    currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES, unique=True)
+    units_per_base = models.DecimalField(max_digits=18, decimal_places=8, validators=[MinValueValidator(0)])
+    updated_at = models.DateTimeField(auto_now=True)
+
+    CACHE_KEY = 'exchange_rates'
+
+    def __str__(self):
+        return f"1 {settings.BASE_CURRENCY} = {self.units_per_base} {self.currency}"
+
+    @classmethod
+    def rates(cls):
+        """{currency: units_per_base}, cached for at most EXCHANGE_RATE_CACHE_TIMEOUT"""
+        rates = cache.get(cls.CACHE_KEY)
+        if rates is None:
+            rates = dict(cls.objects.values_list('currency', 'units_per_base'))
+            rates.setdefault(settings.BASE_CURRENCY, Decimal(1))
+            cache.set(cls.CACHE_KEY, rates, settings.EXCHANGE_RATE_CACHE_TIMEOUT)
+        return rates
+
+    @classmethod
+    def normalize(cls, amount, currency):
+        """amount in currency converted to the base currency, or None without a rate"""
+        rate = cls.rates().get(currency)
+        if amount is None or not rate:
+            return None
+        return (Decimal(amount) / rate).quantize(Decimal('0.01'))
+
+    @classmethod
+    def load(cls, rates):
+        """
+        Upsert {currency: units_per_base} and re-normalize every product price
+        in SQL. Returns the number of products updated.
+        """
+        with transaction.atomic():
+            cls.objects.bulk_create(
+                [cls(currency=currency, units_per_base=rate) for currency, rate in rates.items()],
+                update_conflicts=True,
+                unique_fields=['currency'],
+                update_fields=['units_per_base', 'updated_at']
+            )
+            cache.delete(cls.CACHE_KEY)
+            return Product.recompute_normalized_prices()
+
+# Full-text document for product search
+PRODUCT_SEARCH_VECTOR = SearchVector('title', 'description', config='english')
+
+# ?sort=price and ?sort=-price keys: price_normalized, with products whose
+# currency has no exchange rate yet (NULL) after every priced one in either
+# direction. A plain NULL would sort first on -price and can't be encoded in
+# a cursor position.
+PRODUCT_PRICE_SORT = {
+    descending: Coalesce(
+        'price_normalized', models.Value(unpriced),
+        output_field=models.DecimalField(max_digits=14, decimal_places=2)
+    )
+    for descending, unpriced in ((False, Decimal('999999999999.99')), (True, Decimal('-1')))
+}
+
 # Product Model
-class Product(models.Model):
+class Product(GeoLocatedModel):
     CONDITION_CHOICES = [
         ('NEW', 'New'),
         ('USED', 'Used'),
@@ -475,13 +856,7 @@ class Product(models.Model):
     currency = models.CharField(
         max_length=3, 
         default='USD',
-        choices=[
-            ('USD', 'US Dollar'),
-            ('EUR', 'Euro'),
-            ('GBP', 'British Pound'),
-            ('KES', 'Kenyan Shilling'),
-            ('NGN', 'Nigerian Naira')
-        ]
+        choices=CURRENCY_CHOICES
     )
     seller = models.ForeignKey('User', on_delete=models.CASCADE, related_name='products_for_sale')
     title = models.CharField(max_length=200)
@@ -491,8 +866,19 @@ class Product(models.Model):
         decimal_places=2, 
         validators=[MinValueValidator(0)]
     )
+    # price in settings.BASE_CURRENCY, kept in step with ExchangeRate for cross-currency sorting
+    price_normalized = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True, editable=False)
     condition = models.CharField(max_length=20, choices=CONDITION_CHOICES, default='NEW')
     quantity = models.PositiveIntegerField(default=1)
+    # Review aggregates, maintained by the ProductReview signal receivers
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_average = models.DecimalField(max_digits=3, decimal_places=2, default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
     category = models.ForeignKey(ProductCategory, on_delete=models.SET_NULL, null=True, related_name='products')
     is_digital = models.BooleanField(default=False)
     is_available = models.BooleanField(default=True)
@@ -509,20 +895,122 @@ class Product(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['category', '-created_at'], name='product_category_recent_idx'),
+            models.Index(fields=['is_available', '-created_at'], name='product_available_recent_idx'),
+            models.Index(fields=['is_available', 'price'], name='product_available_price_idx'),
+            models.Index(fields=['is_available', '-views'], name='product_available_views_idx'),
+            models.Index(fields=['is_available', 'price_normalized'], name='product_available_norm_idx'),
+            models.Index(fields=['is_available', '-rating_average'], name='product_top_rated_idx'),
+            # Must match PRODUCT_PRICE_SORT; -price walks its index backwards
+            models.Index(
+                models.F('is_available'), PRODUCT_PRICE_SORT[False], models.F('id'), name='product_price_sort_idx'
+            ),
+            models.Index(
+                models.F('is_available'), PRODUCT_PRICE_SORT[True], models.F('id'), name='product_price_sort_desc_idx'
+            ),
+            # Must match the expression ProductViewSet searches with
+            GinIndex(PRODUCT_SEARCH_VECTOR, name='product_search_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} by {self.seller.username}"
     
     def save(self, *args, **kwargs):
-        if not self.slug:
-            base_slug = slugify(self.title)
-            slug = base_slug
-            counter = 1
-            while Product.objects.filter(slug=slug).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            self.slug = slug
-        super().save(*args, **kwargs)
+        self.price_normalized = ExchangeRate.normalize(self.price, self.currency)
+        save_with_unique_slug(self, self.title, super().save, *args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        product = super().from_db(db, field_names, values)
+        # Lets save() tell when the category tree's product counts change
+        product._loaded_listing = product.listing_state()
+        return product
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._loaded_listing = self.listing_state()
+
+    def listing_state(self):
+        """The loaded fields the category tree's product counts depend on"""
+        return (self.__dict__.get('category_id'), self.__dict__.get('is_available'))
+
+    @property
+    def rating_histogram(self):
+        return {rating: getattr(self, f'rating_{rating}_count') for rating in range(1, 6)}
+
+    @staticmethod
+    def _rating_average(rating_sum, rating_count):
+        return Coalesce(
+            Cast(rating_sum, models.FloatField()) / NullIf(rating_count, 0), 0,
+            output_field=models.DecimalField(max_digits=3, decimal_places=2)
+        )
+
+    @classmethod
+    def apply_rating_change(cls, product_id, added=None, removed=None):
+        """
+        Fold a review rating being added and/or removed (an edit does both)
+        into the product's aggregates with a single atomic UPDATE
+        """
+        if added == removed:
+            return
+        sum_delta = (added or 0) - (removed or 0)
+        count_delta = (added is not None) - (removed is not None)
+        updates = {
+            'rating_sum': models.F('rating_sum') + sum_delta,
+            'rating_count': models.F('rating_count') + count_delta,
+            # The right-hand side sees the pre-update row, so apply the deltas here too
+            'rating_average': cls._rating_average(
+                models.F('rating_sum') + sum_delta, models.F('rating_count') + count_delta
+            ),
+        }
+        if added is not None:
+            updates[f'rating_{added}_count'] = models.F(f'rating_{added}_count') + 1
+        if removed is not None:
+            updates[f'rating_{removed}_count'] = models.F(f'rating_{removed}_count') - 1
+        cls.objects.filter(pk=product_id).update(**updates)
+
+    @classmethod
+    def rebuild_ratings(cls):
+        """Recompute every product's review aggregates from ProductReview"""
+        reviews = ProductReview.objects.filter(product=models.OuterRef('pk')).order_by().values('product')
+
+        def aggregate(expression, **filters):
+            return Coalesce(Subquery(
+                reviews.filter(**filters).annotate(value=expression).values('value')[:1]
+            ), 0)
+
+        rating_sum = aggregate(models.Sum('rating'))
+        rating_count = aggregate(models.Count('pk'))
+        cls.objects.update(
+            rating_sum=rating_sum,
+            rating_count=rating_count,
+            rating_average=cls._rating_average(rating_sum, rating_count),
+            **{
+                f'rating_{rating}_count': aggregate(models.Count('pk'), rating=rating)
+                for rating in range(1, 6)
+            }
+        )
+
+    @classmethod
+    def recompute_normalized_prices(cls):
+        """Re-derive price_normalized for every product in a single UPDATE"""
+        rate = ExchangeRate.objects.filter(currency=models.OuterRef('currency')).values('units_per_base')[:1]
+        return cls.objects.update(price_normalized=models.Case(
+            models.When(currency=settings.BASE_CURRENCY, then=models.F('price')),
+            default=models.F('price') / models.Subquery(rate),
+            output_field=models.DecimalField(max_digits=14, decimal_places=2)
+        ))
+
+    @staticmethod
+    def with_availability(queryset):
+        """Annotate available_quantity: stock not held by an unexpired cart reservation"""
+        held = StockReservation.active().filter(product=models.OuterRef('pk')).order_by().values(
+            'product'
+        ).annotate(total=models.Sum('quantity')).values('total')
+        return queryset.annotate(available_quantity=Greatest(
+            models.F('quantity') - Coalesce(Subquery(held), 0), 0
+        ))
 
 # Product Image Model
 class ProductImage(models.Model):
@@ -555,6 +1043,40 @@ class Cart(models.Model):
     def subtotal(self):
         return sum(item.total_price for item in self.items.all())
 
+    @classmethod
+    def summary(cls, user_id):
+        """Item count, quantity and per-currency subtotals of a user's cart in one query"""
+        rows = CartItem.objects.filter(cart__user_id=user_id).order_by().values(
+            currency=models.F('product__currency')
+        ).annotate(
+            item_count=models.Count('pk'),
+            total_quantity=models.Sum('quantity'),
+            subtotal=models.Sum(
+                models.F('quantity') * models.F('product__price'),
+                output_field=models.DecimalField(max_digits=14, decimal_places=2)
+            ),
+        ).order_by('currency')
+        subtotals = list(rows)
+        return {
+            'item_count': sum(row['item_count'] for row in subtotals),
+            'total_quantity': sum(row['total_quantity'] for row in subtotals),
+            'subtotals': subtotals,
+        }
+
+    @classmethod
+    def badge_count(cls, user_id):
+        """Number of items in a user's cart, cached until the cart changes"""
+        cache_key = versioned_key(CART_NAMESPACE, user_id)
+        count = cache.get(cache_key)
+        if count is None:
+            count = CartItem.objects.filter(cart__user_id=user_id).count()
+            cache.set(cache_key, count, settings.CART_BADGE_CACHE_TIMEOUT)
+        return count
+
+    @staticmethod
+    def invalidate_badge(user_id):
+        bump_version(CART_NAMESPACE, user_id)
+
 # Cart Item Model
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
@@ -573,6 +1095,64 @@ class CartItem(models.Model):
     def total_price(self):
         return self.product.price * self.quantity
 
+class StockReservation(models.Model):
+    """
+    Stock held for a cart item until expires_at. Other buyers can only add
+    or check out Product.quantity minus the unexpired holds; expired rows
+    are ignored everywhere and deleted by release_expired.
+    """
+    cart_item = models.OneToOneField(CartItem, on_delete=models.CASCADE, related_name='reservation')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'expires_at'], name='reservation_product_idx'),
+            models.Index(fields=['expires_at'], name='reservation_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} until {self.expires_at}"
+
+    @classmethod
+    def active(cls):
+        return cls.objects.filter(expires_at__gt=Now())
+
+    @classmethod
+    def held_quantities(cls, product_ids, exclude_cart=None):
+        """{product_id: quantity under unexpired holds}, leaving out exclude_cart's own"""
+        holds = cls.active().filter(product_id__in=product_ids)
+        if exclude_cart is not None:
+            holds = holds.exclude(cart_item__cart=exclude_cart)
+        return dict(
+            holds.order_by().values('product_id').annotate(total=models.Sum('quantity')).values_list('product_id', 'total')
+        )
+
+    @classmethod
+    def hold(cls, cart_item):
+        """Hold the item's full quantity, restarting the reservation timer"""
+        reservation, _ = cls.objects.update_or_create(
+            cart_item=cart_item,
+            defaults={
+                'product_id': cart_item.product_id,
+                'quantity': cart_item.quantity,
+                'expires_at': timezone.now() + timedelta(seconds=settings.CART_RESERVATION_SECONDS),
+            }
+        )
+        return reservation
+
+    @classmethod
+    def release_expired(cls, batch_size):
+        """Delete expired holds batch_size rows at a time; returns how many were released"""
+        cutoff = timezone.now()
+        released = 0
+        while True:
+            ids = list(cls.objects.filter(expires_at__lte=cutoff).values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return released
+            released += cls.objects.filter(id__in=ids).delete()[0]
+
 # Order Model
 class Order(models.Model):
     STATUS_CHOICES = [
@@ -583,6 +1163,8 @@ class Order(models.Model):
         ('CANCELLED', 'Cancelled'),
         ('REFUNDED', 'Refunded'),
     ]
+    # Orders in these statuses are left out of the sales rollups
+    NOT_SALES_STATUSES = ('CANCELLED', 'REFUNDED')
     
     buyer = models.ForeignKey('User', on_delete=models.CASCADE, related_name='purchases')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
@@ -592,19 +1174,90 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     transaction_id = models.CharField(max_length=100, blank=True)
+    # Client-supplied Idempotency-Key of the checkout that created this order
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True)
     
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['buyer', 'idempotency_key'],
+                condition=models.Q(idempotency_key__isnull=False),
+                name='unique_order_idempotency_key'
+            ),
+        ]
     
     def __str__(self):
         return f"Order #{self.id} by {self.buyer.username}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        order = super().from_db(db, field_names, values)
+        # Lets save() tell a status change apart without re-reading the row
+        order._loaded_status = order.__dict__.get('status')
+        return order
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._loaded_status = self.__dict__.get('status')
+
+    @classmethod
+    def set_statuses(cls, statuses, orders=None):
+        """
+        Apply {order_id: status} with one UPDATE, to the orders in the orders
+        queryset only if given, and return the ids updated. Status changes go
+        through here (or Order.save()); see status_changes_applied.
+        """
+        with transaction.atomic():
+            current = list(
+                (cls.objects.all() if orders is None else orders).select_for_update().filter(
+                    id__in=statuses
+                ).order_by('id').values_list('id', 'buyer_id', 'status')
+            )
+            if current:
+                cls.objects.filter(id__in=[order_id for order_id, buyer_id, status in current]).update(
+                    status=models.Case(
+                        *[models.When(id=order_id, then=models.Value(statuses[order_id])) for order_id, _, _ in current],
+                        output_field=models.CharField()
+                    ),
+                    updated_at=timezone.now()
+                )
+                cls.status_changes_applied([
+                    (order_id, buyer_id, previous_status, statuses[order_id])
+                    for order_id, buyer_id, previous_status in current
+                ])
+        return [order_id for order_id, _, _ in current]
+
+    @classmethod
+    def status_changes_applied(cls, changes):
+        """
+        Bring what depends on order status in step with (order_id, buyer_id,
+        previous_status, new_status) changes: the sales rollups, and the
+        cached download entitlements of buyers whose orders stop being sales.
+        A queryset .update(status=...) anywhere else must call this too.
+        """
+        # Import here: songs.downloads imports this module
+        from .downloads import revoke_downloads
+
+        SalesRollup.statuses_changed([
+            (order_id, previous_status, new_status) for order_id, _, previous_status, new_status in changes
+        ])
+        revoked = {
+            buyer_id for _, buyer_id, previous_status, new_status in changes
+            if new_status in cls.NOT_SALES_STATUSES and previous_status != new_status
+        }
+        for buyer_id in revoked:
+            # After commit, so a download racing the change can't re-cache the old status
+            transaction.on_commit(lambda buyer_id=buyer_id: revoke_downloads(buyer_id))
+
 # Order Item Model
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True)
     quantity = models.PositiveIntegerField()
     price_at_purchase = models.DecimalField(max_digits=10, decimal_places=2)
+    # Currency of price_at_purchase, kept even if the product is deleted
+    currency = models.CharField(max_length=3, default='USD', choices=CURRENCY_CHOICES)
     seller = models.ForeignKey('User', on_delete=models.SET_NULL, null=True, related_name='sales')
     
     class Meta:
@@ -617,6 +1270,176 @@ class OrderItem(models.Model):
     def total_price(self):
         return self.price_at_purchase * self.quantity
 
+class SellerDailySales(models.Model):
+    """A seller's sales for one day in one currency, built by SalesRollup"""
+    seller = models.ForeignKey('User', on_delete=models.CASCADE, related_name='daily_sales')
+    day = models.DateField()
+    currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    order_count = models.PositiveIntegerField(default=0)
+
+    KEY_FIELDS = ('seller_id', 'day', 'currency')
+
+    class Meta:
+        ordering = ['day']
+        constraints = [
+            models.UniqueConstraint(fields=['seller', 'day', 'currency'], name='unique_seller_daily_sales'),
+        ]
+
+    def __str__(self):
+        return f"{self.seller_id} {self.day}: {self.revenue} {self.currency}"
+
+class ProductDailySales(models.Model):
+    """A product's sales for one day in one currency, built by SalesRollup"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    seller = models.ForeignKey('User', on_delete=models.CASCADE, related_name='product_daily_sales')
+    day = models.DateField()
+    currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    order_count = models.PositiveIntegerField(default=0)
+
+    KEY_FIELDS = ('product_id', 'seller_id', 'day', 'currency')
+
+    class Meta:
+        ordering = ['day']
+        constraints = [
+            # Seller is part of the key: it comes from the order item, which
+            # need not match the product's current seller
+            models.UniqueConstraint(fields=['product', 'seller', 'day', 'currency'], name='unique_product_daily_sales'),
+        ]
+        indexes = [
+            models.Index(fields=['seller', 'day'], name='product_daily_sales_seller_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} {self.day}: {self.revenue} {self.currency}"
+
+class SalesRollup(models.Model):
+    """
+    High-water mark of the daily sales rollups: every order with an id up to
+    last_order_id has been folded into SellerDailySales and ProductDailySales.
+    A single row, locked while a run or a status change updates the rollups.
+
+    Rollups only stay correct if every status change of an already rolled up
+    order reaches statuses_changed: Order.set_statuses and Order.save() do
+    that, a bare queryset .update(status=...) does not.
+    """
+    last_order_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Sales rolled up to order #{self.last_order_id}"
+
+    @classmethod
+    def lock(cls):
+        state, _ = cls.objects.select_for_update().get_or_create(pk=1)
+        return state
+
+    @classmethod
+    def run(cls, rebuild=False):
+        """
+        Fold orders placed since the last run into the rollups and return how
+        many were read. Orders younger than SALES_ROLLUP_SETTLE_SECONDS wait
+        for the next run, so a checkout still committing below the new mark
+        is not skipped. rebuild=True starts again from an empty table.
+        """
+        settled = timezone.now() - timedelta(seconds=settings.SALES_ROLLUP_SETTLE_SECONDS)
+        with transaction.atomic():
+            state = cls.lock()
+            if rebuild:
+                SellerDailySales.objects.all().delete()
+                ProductDailySales.objects.all().delete()
+                state.last_order_id = 0
+            top = Order.objects.filter(
+                id__gt=state.last_order_id, created_at__lte=settled
+            ).aggregate(top=models.Max('id'))['top']
+            if top is None:
+                return 0
+            orders = Order.objects.filter(id__gt=state.last_order_id, id__lte=top)
+            count = orders.count()
+            cls._fold(orders.exclude(status__in=Order.NOT_SALES_STATUSES), 1)
+            state.last_order_id = top
+            state.save()
+        return count
+
+    @classmethod
+    def statuses_changed(cls, changes):
+        """
+        Take already rolled up orders out of the rollups when they are cancelled
+        or refunded, and put them back if that is undone. changes holds
+        (order_id, previous_status, new_status) tuples.
+        """
+        restored, removed = [], []
+        for order_id, previous_status, new_status in changes:
+            was_sale = previous_status not in Order.NOT_SALES_STATUSES
+            is_sale = new_status not in Order.NOT_SALES_STATUSES
+            if was_sale != is_sale:
+                (restored if is_sale else removed).append(order_id)
+        if not restored and not removed:
+            return
+        with transaction.atomic():
+            last_order_id = cls.lock().last_order_id
+            for order_ids, sign in ((restored, 1), (removed, -1)):
+                order_ids = [order_id for order_id in order_ids if order_id <= last_order_id]
+                if order_ids:
+                    cls._fold(Order.objects.filter(pk__in=order_ids), sign)
+
+    @classmethod
+    def _fold(cls, orders, sign):
+        """Add (sign=1) or subtract (sign=-1) the items of orders from both rollups"""
+        items = OrderItem.objects.filter(order__in=orders, seller__isnull=False).annotate(
+            day=TruncDate('order__created_at')
+        ).order_by()
+        totals = {
+            'units': models.Sum('quantity'),
+            'revenue': models.Sum(
+                models.F('quantity') * models.F('price_at_purchase'),
+                output_field=models.DecimalField(max_digits=14, decimal_places=2)
+            ),
+            'order_count': models.Count('order_id', distinct=True),
+        }
+        cls._accumulate(SellerDailySales, items.values(*SellerDailySales.KEY_FIELDS).annotate(**totals), sign)
+        cls._accumulate(
+            ProductDailySales,
+            items.filter(product__isnull=False).values(*ProductDailySales.KEY_FIELDS).annotate(**totals),
+            sign
+        )
+
+    @staticmethod
+    def _accumulate(model, groups, sign):
+        groups = list(groups)
+        if not groups:
+            return
+        existing = {
+            tuple(getattr(row, field) for field in model.KEY_FIELDS): row
+            for row in model.objects.filter(
+                day__in={group['day'] for group in groups},
+                seller_id__in={group['seller_id'] for group in groups}
+            )
+        }
+        created, updated = [], []
+        for group in groups:
+            key = tuple(group[field] for field in model.KEY_FIELDS)
+            row = existing.get(key)
+            if row is None:
+                row = model(**dict(zip(model.KEY_FIELDS, key)))
+                created.append(row)
+            else:
+                updated.append(row)
+            row.units += sign * group['units']
+            row.revenue += sign * group['revenue']
+            row.order_count += sign * group['order_count']
+        model.objects.bulk_create(created)
+        model.objects.bulk_update(
+            [row for row in updated if row.order_count], ['units', 'revenue', 'order_count']
+        )
+        # A day whose only orders were cancelled leaves no row, as in a rebuild
+        emptied = [row.pk for row in updated if not row.order_count]
+        if emptied:
+            model.objects.filter(pk__in=emptied).delete()
+
 # Product Review Model
 class ProductReview(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reviews')
@@ -746,33 +1569,28 @@ class LiveEvent(models.Model):
             )
         return None
     
+    # Thumbnail sizes from best to worst; only some exist for a given video
+    THUMBNAIL_QUALITIES = ('maxresdefault', 'hqdefault', 'mqdefault', 'default')
+    # Exists for every video, so it is stored until a better one is found
+    PLACEHOLDER_THUMBNAIL_QUALITY = 'mqdefault'
+
+    @staticmethod
+    def thumbnail_url(video_id, quality=PLACEHOLDER_THUMBNAIL_QUALITY):
+        return f"{settings.YOUTUBE_THUMBNAIL_BASE_URL}/{video_id}/{quality}.jpg"
+
+    def has_placeholder_thumbnail(self):
+        video_id = self.extract_youtube_id(self.youtube_url)
+        return bool(video_id) and self.thumbnail == self.thumbnail_url(video_id)
+
     def save(self, *args, **kwargs):
-        """Override save to ensure validation and set thumbnail"""
+        """Validate, and store the placeholder thumbnail if none was given"""
         self.full_clean()
         
-        # Always try to set thumbnail if not provided
+        # The best available quality is looked up in the background, see
+        # songs.thumbnails and the LiveEvent post_save receiver
         if not self.thumbnail:
             video_id = self.extract_youtube_id(self.youtube_url)
             if video_id:
-                # Try multiple thumbnail qualities
-                thumbnail_options = [
-                    f"https://img.youtube.com/vi/{video_id}/maxresdefault.jpg",
-                    f"https://img.youtube.com/vi/{video_id}/hqdefault.jpg",
-                    f"https://img.youtube.com/vi/{video_id}/mqdefault.jpg",
-                    f"https://img.youtube.com/vi/{video_id}/default.jpg"
-                ]
-                
-                # Set the first available thumbnail
-                for thumb_url in thumbnail_options:
-                    if self.thumbnail_exists(thumb_url):
-                        self.thumbnail = thumb_url
-                        break
+                self.thumbnail = self.thumbnail_url(video_id)
         
-        super().save(*args, **kwargs)
-    def thumbnail_exists(self, url):
-        """Check if thumbnail URL is valid"""
-        try:
-            response = requests.head(url, timeout=2)
-            return response.status_code == 200
-        except:
-            return False
\ No newline at end of file
+        super().save(*args, **kwargs)
\ No newline at end of file
@@ -0,0 +1,27 @@
+from rest_framework.pagination import CursorPagination
+
+
+class OptInCursorPagination(CursorPagination):
+    """
+    Cursor pagination that only kicks in when the client asks for it with
+    ?cursor= or ?page_size=, so existing clients keep getting plain lists.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+class GroupPostCursorPagination(OptInCursorPagination):
+    ordering = '-created_at'
+
+
+class ProductCursorPagination(OptInCursorPagination):
+    def get_ordering(self, request, queryset, view):
+        # Follows the ?sort= the view applied
+        return view.get_sort_ordering()
@@ -3,6 +3,7 @@ from .models import User
 from .models import User,Track,Playlist,Profile,LiveEvent, Comment,Like,Category,SocialPost,PostLike,PostComment,PostSave,Notification,Church,Choir,Group,Videostudio,Choir, GroupMember, GroupJoinRequest, GroupPost,GroupPostAttachment,ProductCategory,ProductImage,Product,CartItem,Cart,OrderItem,Order,ProductReview,Wishlist
 import re
 from django.utils import timezone
+from .uploads import upload_to_field
 import logging
 logger = logging.getLogger(__name__)
 
@@ -127,6 +128,16 @@ class UserSerializer(serializers.ModelSerializer):
         password = validated_data.pop('password')
         user = User.objects.create_user(password=password, **validated_data)
         return user
+
+class UserSummarySerializer(serializers.ModelSerializer):
+    """Compact user representation without nested posts or follow lookups"""
+    avatar = CloudinaryFieldSerializer(read_only=True)
+
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'avatar']
+        read_only_fields = fields
+
 class TrackSerializer(serializers.ModelSerializer):
      likes_count = serializers.SerializerMethodField()
      is_liked = serializers.SerializerMethodField()
@@ -312,7 +323,7 @@ class ChurchSerializer(serializers.ModelSerializer):
     image = CloudinaryFieldSerializer(read_only=True)
     created_by_username = serializers.CharField(source='created_by.username', read_only=True)
     created_by_picture = CloudinaryFieldSerializer(source='created_by.profile.picture', read_only=True)
-    
+    distance = serializers.FloatField(read_only=True)
     
     class Meta:
         model = Church
@@ -339,6 +350,7 @@ class VideoStudioSerializer(serializers.ModelSerializer):
     created_by_username = serializers.CharField(source='created_by.username', read_only=True)
     created_by_picture = CloudinaryFieldSerializer(source='created_by.profile.picture', read_only=True)
     service_types = serializers.ListField(child=serializers.ChoiceField(choices=Videostudio.SERVICE_TYPES),default=list)
+    distance = serializers.FloatField(read_only=True)
     
     class Meta:
         model = Videostudio
@@ -369,10 +381,11 @@ class ChoirSerializer(serializers.ModelSerializer):
     created_by = UserSerializer(read_only=True)
     profile_image = CloudinaryFieldSerializer(read_only=True)
     cover_image = CloudinaryFieldSerializer(read_only=True)
+    distance = serializers.FloatField(read_only=True)
     
     class Meta:
         model = Choir
-        fields = '__all__'
+        exclude = ['members']
         read_only_fields = ('created_by', 'members_count')
     
     def get_profile_image_url(self, obj):
@@ -386,7 +399,7 @@ class ChoirSerializer(serializers.ModelSerializer):
         return None
     
 class GroupSerializer(serializers.ModelSerializer):
-    creator = UserSerializer(read_only=True)
+    creator = UserSummarySerializer(read_only=True)
     member_count = serializers.SerializerMethodField()
     is_member = serializers.SerializerMethodField()
     is_admin = serializers.SerializerMethodField()
@@ -399,23 +412,33 @@ class GroupSerializer(serializers.ModelSerializer):
         read_only_fields = ['creator', 'slug', 'created_at', 'updated_at']
     
     def get_member_count(self, obj):
+        # Annotated by GroupViewSet; fall back to counting for lone instances
+        if hasattr(obj, 'member_total'):
+            return obj.member_total
         return obj.members.count()
+
+    def get_viewer_membership(self, obj):
+        """
+        The viewer's flags for obj. Views pass the viewer's whole membership
+        map in the context ('memberships', see GroupMember.memberships_for) so
+        a page of groups needs no per-group queries.
+        """
+        memberships = self.context.get('memberships')
+        if memberships is not None:
+            return memberships.get(obj.id, {})
+        request = self.context.get('request')
+        if not request or not request.user.is_authenticated:
+            return {}
+        membership = GroupMember.objects.filter(group=obj, user=request.user).values('is_admin').first()
+        if membership is None:
+            return {}
+        return {'is_member': True, 'is_admin': membership['is_admin']}
     
     def get_is_member(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return GroupMember.objects.filter(group=obj, user=request.user).exists()
-        return False
+        return self.get_viewer_membership(obj).get('is_member', False)
     
     def get_is_admin(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return GroupMember.objects.filter(
-                group=obj, 
-                user=request.user, 
-                is_admin=True
-            ).exists()
-        return False
+        return self.get_viewer_membership(obj).get('is_admin', False)
 
 class GroupMemberSerializer(serializers.ModelSerializer):
     user = serializers.SerializerMethodField()
@@ -454,7 +477,7 @@ class GroupPostAttachmentSerializer(serializers.ModelSerializer):
 
 class GroupPostSerializer(serializers.ModelSerializer):
     # user = serializers.StringRelatedField(read_only=True)
-    user = UserSerializer(read_only=True)
+    user = UserSummarySerializer(read_only=True)
     attachments = GroupPostAttachmentSerializer(many=True, read_only=True, required=False)
     
     class Meta:
@@ -472,6 +495,11 @@ class ProductCategorySerializer(serializers.ModelSerializer):
         model = ProductCategory
         fields = '__all__'
 
+    def validate_parent(self, value):
+        if value and self.instance and self.instance.subtree_contains(value.pk):
+            raise serializers.ValidationError("A category cannot be moved under itself or its subcategories")
+        return value
+
 class ProductImageSerializer(serializers.ModelSerializer):
     image = CloudinaryFieldSerializer(read_only=True)
     image_url = serializers.SerializerMethodField()
@@ -488,7 +516,7 @@ class ProductImageSerializer(serializers.ModelSerializer):
         return None
 
 class ProductSerializer(serializers.ModelSerializer):
-    seller = serializers.SerializerMethodField()
+    seller = UserSummarySerializer(read_only=True)
     currency = serializers.CharField(max_length=3)
     images = serializers.ListField(
         child=serializers.ImageField(),
@@ -503,6 +531,10 @@ class ProductSerializer(serializers.ModelSerializer):
         allow_null=True
     )
     is_owner = serializers.SerializerMethodField()
+    distance = serializers.FloatField(read_only=True)
+    # Annotated by Product.with_availability; left out where it isn't
+    available_quantity = serializers.IntegerField(read_only=True)
+    rating_histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
 
     class Meta:
         model = Product
@@ -510,19 +542,28 @@ class ProductSerializer(serializers.ModelSerializer):
             'id', 'seller', 'title', 'description', 'price', 'condition',
             'quantity', 'category', 'is_digital', 'is_available', 'created_at',
             'updated_at', 'views', 'slug', 'images', 'is_owner', 'track','currency','whatsapp_number', 'contact_number', 'location',
+            'latitude', 'longitude', 'distance', 'price_normalized',
+            'rating_average', 'rating_count', 'rating_histogram', 'available_quantity',
+        ]
+        read_only_fields = [
+            'seller', 'created_at', 'updated_at', 'views', 'slug', 'price_normalized',
+            'rating_average', 'rating_count',
         ]
-        read_only_fields = ['seller', 'created_at', 'updated_at', 'views', 'slug']
 
-    def get_seller(self, obj):
-        try:
-            return UserSerializer(obj.seller, context=self.context).data
-        except AttributeError:
-            return None
+    @staticmethod
+    def setup_eager_loading(queryset, prefix=''):
+        """
+        Load the relations this serializer reads alongside queryset. Pass the
+        lookup path as prefix (e.g. 'product__') when products are nested.
+        """
+        return queryset.select_related(
+            f'{prefix}seller', f'{prefix}category'
+        ).prefetch_related(f'{prefix}images')
 
     def get_is_owner(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return obj.seller == request.user
+            return obj.seller_id == request.user.id
         return False
 
     def validate_category(self, value):
@@ -554,8 +595,10 @@ class ProductSerializer(serializers.ModelSerializer):
             category=category,
             **validated_data
         )
-        for image in images:
-            ProductImage.objects.create(product=product, image=image)
+        uploaded, product.upload_errors = upload_to_field(
+            [ProductImage(product=product) for _ in images], 'image', images
+        )
+        ProductImage.objects.bulk_create(uploaded)
         return product
 
     def to_representation(self, instance):
@@ -566,6 +609,8 @@ class ProductSerializer(serializers.ModelSerializer):
             context=self.context
         ).data
         representation['category'] = instance.category.name if instance.category else None
+        if getattr(instance, 'upload_errors', None):
+            representation['upload_errors'] = instance.upload_errors
         return representation
     
     def update(self, instance, validated_data):
@@ -587,15 +632,22 @@ class ProductSerializer(serializers.ModelSerializer):
 class CartItemSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     total_price = serializers.SerializerMethodField()
+    reserved_until = serializers.SerializerMethodField()
     
     class Meta:
         model = CartItem
-        fields = ['id', 'product', 'quantity', 'added_at', 'total_price']
+        fields = ['id', 'product', 'quantity', 'added_at', 'total_price', 'reserved_until']
         read_only_fields = ['added_at']
     
     def get_total_price(self, obj):
         return obj.product.price * obj.quantity
 
+    def get_reserved_until(self, obj):
+        reservation = getattr(obj, 'reservation', None)
+        if reservation and reservation.expires_at > timezone.now():
+            return reservation.expires_at
+        return None
+
 class CartSerializer(serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
     subtotal = serializers.SerializerMethodField()
@@ -618,15 +670,15 @@ class OrderItemSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = OrderItem
-        fields = ['id', 'product', 'quantity', 'price_at_purchase', 'total_price', 'seller']
-        read_only_fields = ['price_at_purchase', 'seller']
+        fields = ['id', 'product', 'quantity', 'price_at_purchase', 'currency', 'total_price', 'seller']
+        read_only_fields = ['price_at_purchase', 'currency', 'seller']
     
     def get_total_price(self, obj):
         return obj.price_at_purchase * obj.quantity
 
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
-    buyer = UserSerializer(read_only=True)
+    buyer = UserSummarySerializer(read_only=True)
     seller = UserSerializer(read_only=True)
     
     class Meta:
@@ -638,6 +690,23 @@ class OrderSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['buyer', 'seller', 'total_amount', 'created_at', 'updated_at']
 
+class ProductBulkEditSerializer(serializers.Serializer):
+    """One row of a seller's bulk product edit"""
+    id = serializers.IntegerField()
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    quantity = serializers.IntegerField(min_value=0, max_value=2147483647, required=False)
+    is_available = serializers.BooleanField(required=False)
+
+    def validate(self, data):
+        if len(data) == 1:
+            raise serializers.ValidationError("Give at least one of price, quantity or is_available.")
+        return data
+
+class OrderStatusEditSerializer(serializers.Serializer):
+    """One row of a seller's bulk order status change"""
+    id = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
+
 class ProductReviewSerializer(serializers.ModelSerializer):
     reviewer = UserSerializer(read_only=True)
     
@@ -808,7 +877,6 @@ class LiveEventSerializer(serializers.ModelSerializer):
             youtube_url=url,
             title=validated_data['title'],
             description=validated_data.get('description', ''),
-            thumbnail=f"https://img.youtube.com/vi/{video_id}/maxresdefault.jpg",
             is_live=True,
             start_time=timezone.now(),
             viewers_count=0
@@ -818,6 +886,30 @@ class LiveEventSerializer(serializers.ModelSerializer):
         return LiveEvent.objects.get(id=event.id)
 
 
+class BootstrapJoinRequestSerializer(serializers.ModelSerializer):
+    user = UserSummarySerializer(read_only=True)
+    group_slug = serializers.CharField(source='group.slug', read_only=True)
+    group_name = serializers.CharField(source='group.name', read_only=True)
+
+    class Meta:
+        model = GroupJoinRequest
+        fields = ['id', 'group_slug', 'group_name', 'user', 'message', 'created_at']
+        read_only_fields = fields
+
+
+class BootstrapLiveEventSerializer(serializers.ModelSerializer):
+    user = UserSummarySerializer(read_only=True)
+    embed_url = serializers.CharField(source='get_embed_url', read_only=True)
+
+    class Meta:
+        model = LiveEvent
+        fields = [
+            'id', 'user', 'title', 'youtube_url', 'embed_url',
+            'thumbnail', 'start_time', 'viewers_count'
+        ]
+        read_only_fields = fields
+
+
 
 class FileSizeValidator:
     def __init__(self, max_size_mb):
@@ -0,0 +1,156 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from .caching import CATEGORY_TREE_NAMESPACE, GROUP_MEMBERSHIP_NAMESPACE, PUBLIC_GROUPS_NAMESPACE, bump_version
+from .models import (
+    Church, ChurchFacetCount, Group, GroupMember, LiveEvent, Order, Product, ProductCategory,
+    ProductCategoryClosure, ProductReview
+)
+from .thumbnails import queue_thumbnail_update
+
+
+def _path_keys(church):
+    return {(level, tuple(path.items())) for level, path in church.hierarchy_paths()}
+
+
+@receiver(pre_save, sender=Church)
+def remember_church_hierarchy(sender, instance, raw=False, **kwargs):
+    instance._previous_paths = set()
+    if instance.pk and not raw:
+        previous = Church.objects.filter(pk=instance.pk).only(*Church.HIERARCHY).first()
+        if previous:
+            instance._previous_paths = _path_keys(previous)
+
+
+@receiver(post_save, sender=Church)
+def update_church_facets_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_paths', set())
+    current = _path_keys(instance)
+    with transaction.atomic():
+        for level, path in previous - current:
+            ChurchFacetCount.adjust(level, dict(path), -1)
+        for level, path in current - previous:
+            ChurchFacetCount.adjust(level, dict(path), 1)
+
+
+@receiver(post_delete, sender=Church)
+def update_church_facets_on_delete(sender, instance, **kwargs):
+    with transaction.atomic():
+        for level, path in _path_keys(instance):
+            ChurchFacetCount.adjust(level, dict(path), -1)
+
+
+@receiver(post_save, sender=GroupMember)
+@receiver(post_delete, sender=GroupMember)
+def invalidate_group_membership(sender, instance, **kwargs):
+    bump_version(GROUP_MEMBERSHIP_NAMESPACE, instance.user_id)
+    bump_version(PUBLIC_GROUPS_NAMESPACE, 'all')
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_listing(sender, instance, created=False, **kwargs):
+    if created:
+        bump_version(GROUP_MEMBERSHIP_NAMESPACE, instance.creator_id)
+    bump_version(PUBLIC_GROUPS_NAMESPACE, 'all')
+
+
+@receiver(pre_save, sender=ProductReview)
+def remember_review_rating(sender, instance, raw=False, **kwargs):
+    instance._previous_rating = None
+    if instance.pk and not raw:
+        instance._previous_rating = ProductReview.objects.filter(pk=instance.pk).values_list(
+            'product_id', 'rating'
+        ).first()
+
+
+@receiver(post_save, sender=ProductReview)
+def update_product_rating_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_rating', None)
+    with transaction.atomic():
+        if previous and previous[0] != instance.product_id:
+            # Moved to another product: take it off the old one entirely
+            Product.apply_rating_change(previous[0], removed=previous[1])
+            previous = None
+        Product.apply_rating_change(
+            instance.product_id, added=instance.rating, removed=previous[1] if previous else None
+        )
+
+
+@receiver(post_delete, sender=ProductReview)
+def update_product_rating_on_delete(sender, instance, **kwargs):
+    Product.apply_rating_change(instance.product_id, removed=instance.rating)
+
+
+@receiver(post_save, sender=Order)
+def apply_order_status_change(sender, instance, created=False, raw=False, **kwargs):
+    previous = getattr(instance, '_loaded_status', None)
+    instance._loaded_status = instance.status
+    if raw or created or previous is None or previous == instance.status:
+        return
+    Order.status_changes_applied([(instance.pk, instance.buyer_id, previous, instance.status)])
+
+
+@receiver(pre_save, sender=ProductCategory)
+def remember_category_parent(sender, instance, raw=False, **kwargs):
+    instance._previous_parent = None
+    if instance.pk and not raw:
+        instance._previous_parent = ProductCategory.objects.filter(pk=instance.pk).values_list(
+            'parent_id', flat=True
+        ).first()
+
+
+def invalidate_category_tree_on_commit():
+    # After the commit, so a tree rebuilt in between can't cache the old rows
+    # under the new version
+    transaction.on_commit(lambda: bump_version(CATEGORY_TREE_NAMESPACE, 'all'))
+
+
+@receiver(post_save, sender=ProductCategory)
+def update_category_closure_on_save(sender, instance, created=False, raw=False, **kwargs):
+    invalidate_category_tree_on_commit()
+    if raw:
+        return
+    with transaction.atomic():
+        if created:
+            ProductCategoryClosure.attach(instance.pk, instance.parent_id)
+        elif getattr(instance, '_previous_parent', None) != instance.parent_id:
+            ProductCategoryClosure.detach(instance.pk)
+            ProductCategoryClosure.attach(instance.pk, instance.parent_id)
+
+
+@receiver(pre_delete, sender=ProductCategory)
+def update_category_closure_on_delete(sender, instance, **kwargs):
+    # The children are orphaned (parent is SET_NULL) and become roots; the
+    # category's own rows go with it by cascade
+    ProductCategoryClosure.detach(instance.pk)
+
+
+@receiver(post_delete, sender=ProductCategory)
+def invalidate_category_tree(sender, instance, **kwargs):
+    invalidate_category_tree_on_commit()
+
+
+@receiver(post_save, sender=Product)
+def invalidate_category_counts_on_save(sender, instance, created=False, raw=False, **kwargs):
+    previous = getattr(instance, '_loaded_listing', None)
+    instance._loaded_listing = instance.listing_state()
+    if raw or not (created or previous != instance._loaded_listing):
+        return
+    invalidate_category_tree_on_commit()
+
+
+@receiver(post_delete, sender=Product)
+def invalidate_category_counts_on_delete(sender, instance, **kwargs):
+    invalidate_category_tree_on_commit()
+
+
+@receiver(post_save, sender=LiveEvent)
+def resolve_live_event_thumbnail(sender, instance, raw=False, **kwargs):
+    if not raw and instance.has_placeholder_thumbnail():
+        queue_thumbnail_update(instance)
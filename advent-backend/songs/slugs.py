@@ -0,0 +1,69 @@
+"""Unique slug allocation shared by Track, Group and Product.
+
+The next free slug is found with one query over the unique slug index:
+``base`` if unused, otherwise ``base-N`` where N is one past the highest
+numeric suffix (of up to SLUG_SUFFIX_DIGITS digits) in use, or a random one
+once those run out. Two concurrent creates can still pick the same slug, so
+saves retry with a fresh allocation when the unique index rejects them.
+"""
+import random
+import re
+
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Cast, Substr
+from django.utils.text import slugify
+
+SLUG_SAVE_ATTEMPTS = 5
+# Room left for a "-N" suffix when truncating long titles
+SLUG_SUFFIX_ROOM = 8
+# Longest suffix counted and allocated; longer ones are ignored, so the cast
+# can't overflow
+SLUG_SUFFIX_DIGITS = SLUG_SUFFIX_ROOM - 1
+
+
+def allocate_slug(model, source, field_name='slug'):
+    max_length = model._meta.get_field(field_name).max_length
+    base = slugify(source)[:max_length - SLUG_SUFFIX_ROOM].strip('-') or model._meta.model_name
+    suffix = Substr(field_name, len(base) + 2)
+    taken = model._default_manager.filter(
+        # The prefix match lets the database use the slug index
+        **{f'{field_name}__startswith': base}
+    ).filter(
+        models.Q(**{field_name: base})
+        | models.Q(**{f'{field_name}__regex': rf'^{re.escape(base)}-[0-9]{{1,{SLUG_SUFFIX_DIGITS}}}$'})
+    ).aggregate(
+        top=models.Max(models.Case(
+            models.When(**{field_name: base}, then=models.Value(0)),
+            # CASE keeps the cast off the bare base row
+            default=Cast(suffix, models.BigIntegerField()),
+            output_field=models.BigIntegerField()
+        )),
+        count=models.Count('pk')
+    )
+    if not taken['count']:
+        return base
+    suffix = taken['top'] + 1
+    if suffix >= 10 ** SLUG_SUFFIX_DIGITS:
+        # Out of counted suffixes; a random one only collides rarely, and saves retry
+        suffix = random.randrange(10 ** (SLUG_SUFFIX_DIGITS - 1), 10 ** SLUG_SUFFIX_DIGITS)
+    return f"{base}-{suffix}"
+
+
+def save_with_unique_slug(instance, source, save, *args, **kwargs):
+    """
+    Call save(*args, **kwargs), first allocating instance.slug from source if
+    it is blank. A collision on the slug index means a concurrent create took
+    the same slug, so allocate again and retry; other integrity errors raise.
+    """
+    if instance.slug:
+        return save(*args, **kwargs)
+    model = type(instance)
+    for attempt in range(SLUG_SAVE_ATTEMPTS):
+        instance.slug = allocate_slug(model, source)
+        try:
+            with transaction.atomic():
+                return save(*args, **kwargs)
+        except IntegrityError:
+            if attempt == SLUG_SAVE_ATTEMPTS - 1 or not model._default_manager.filter(slug=instance.slug).exists():
+                instance.slug = ''
+                raise
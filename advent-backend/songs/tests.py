@@ -1,3 +1,845 @@
-from django.test import TestCase
+import csv
+import io
+import socket
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+import cloudinary
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .caching import CATEGORY_TREE_NAMESPACE, DOWNLOADS_NAMESPACE, get_version
+from .downloads import BufferedCounter
+from .models import (
+    Cart, CartItem, ExchangeRate, Group, GroupJoinRequest, GroupMember, GroupPost, LiveEvent, Notification, Order,
+    OrderItem, Product, ProductCategory, ProductCategoryClosure, ProductDailySales, ProductImage, ProductReview,
+    SalesRollup, SellerDailySales, StockReservation, Track, User
+)
+from .slugs import allocate_slug
+from .thumbnails import resolve_thumbnail
+
+
+def make_user(username, **extra):
+    return User.objects.create_user(username=username, email=f'{username}@example.com', password='pass1234', **extra)
+
+
+def make_product(seller, title, price=Decimal('10.00'), **extra):
+    return Product.objects.create(seller=seller, title=title, description='A product', price=price, **extra)
+
+
+class ProductPriceSortTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.seller = make_user('seller')
+        make_product(self.seller, 'Cheap', Decimal('10.00'))
+        make_product(self.seller, 'Dear', Decimal('20.00'))
+        # No EUR rate is loaded, so these have no price_normalized
+        make_product(self.seller, 'Euro A', Decimal('30.00'), currency='EUR')
+        make_product(self.seller, 'Euro B', Decimal('40.00'), currency='EUR')
+
+    def walk(self, sort):
+        url = f'/api/marketplace/products/?sort={sort}&page_size=1'
+        titles = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            titles += [product['title'] for product in response.data['results']]
+            url = response.data['next']
+        return titles
+
+    def test_unpriced_products_page_after_priced_ones(self):
+        self.assertEqual(self.walk('price'), ['Cheap', 'Dear', 'Euro A', 'Euro B'])
+        self.assertEqual(self.walk('-price'), ['Dear', 'Cheap', 'Euro B', 'Euro A'])
+
+    def test_loading_a_rate_prices_them(self):
+        ExchangeRate.load({'EUR': Decimal('2.5')})
+        self.assertEqual(self.walk('-price'), ['Dear', 'Euro B', 'Euro A', 'Cheap'])
+
+
+class AllocateSlugTests(TestCase):
+    def setUp(self):
+        self.artist = make_user('artist')
+
+    def add_tracks(self, *slugs):
+        Track.objects.bulk_create([Track(title='Hymn', artist=self.artist, slug=slug) for slug in slugs])
+
+    def test_one_query_however_many_duplicates(self):
+        self.add_tracks('hymn')
+        with self.assertNumQueries(1):
+            self.assertEqual(allocate_slug(Track, 'Hymn'), 'hymn-1')
+        self.add_tracks(*[f'hymn-{n}' for n in range(1, 500)])
+        with self.assertNumQueries(1):
+            self.assertEqual(allocate_slug(Track, 'Hymn'), 'hymn-500')
+
+    def test_oversized_suffixes_are_ignored(self):
+        self.add_tracks('worship', 'worship-99999999999999999999')
+        self.assertEqual(allocate_slug(Track, 'Worship'), 'worship-1')
+
+    def test_allocated_suffixes_are_counted_past_six_digits(self):
+        self.add_tracks('worship-999999')
+        slugs = [Track.objects.create(title='Worship', artist=self.artist).slug for _ in range(3)]
+        self.assertEqual(slugs, ['worship-1000000', 'worship-1000001', 'worship-1000002'])
+
+    def test_random_suffix_once_counted_suffixes_run_out(self):
+        self.add_tracks('worship-9999999')
+        slugs = {Track.objects.create(title='Worship', artist=self.artist).slug for _ in range(3)}
+        self.assertEqual(len(slugs), 3)
+        for slug in slugs:
+            self.assertRegex(slug, r'^worship-[1-9][0-9]{6}$')
+
+
+class GroupPostFeedTests(TestCase):
+    def setUp(self):
+        self.user = make_user('member')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.group = Group.objects.create(creator=self.user, name='Praise Team')
+
+    def test_unknown_group_is_404(self):
+        self.assertEqual(self.client.get('/api/groups/no-such-group/posts/').status_code, 404)
+
+    def test_group_without_posts_is_an_empty_list(self):
+        response = self.client.get(f'/api/groups/{self.group.slug}/posts/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [])
+
+
+class GroupUnreadCountTests(TestCase):
+    def setUp(self):
+        self.reader = make_user('reader')
+        self.poster = make_user('poster')
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def add_groups(self, count):
+        for n in range(count):
+            group = Group.objects.create(creator=self.poster, name=f'Choir {n}')
+            GroupMember.objects.create(group=group, user=self.reader)
+            GroupMember.objects.create(group=group, user=self.poster)
+            GroupPost.objects.bulk_create(
+                [GroupPost(group=group, user=self.poster, content='Rehearsal moved')] * (n + 1)
+                + [GroupPost(group=group, user=self.reader, content='Thanks')]
+            )
+
+    def test_one_query_for_every_group(self):
+        self.add_groups(1)
+        with self.assertNumQueries(1):
+            self.client.get('/api/groups/unread-counts/')
+        self.add_groups(2)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/groups/unread-counts/')
+        # The reader's own posts are not unread
+        self.assertEqual(sorted(response.data.values()), [1, 1, 2])
+
+    def test_mark_read_clears_the_badge(self):
+        self.add_groups(1)
+        slug = Group.objects.get().slug
+        self.assertEqual(self.client.post(f'/api/groups/{slug}/mark-read/').status_code, 200)
+        self.assertEqual(self.client.get('/api/groups/unread-counts/').data, {slug: 0})
+
+
+class BulkJoinReviewTests(TestCase):
+    def setUp(self):
+        self.admin = make_user('admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.group = Group.objects.create(creator=self.admin, name='Praise Team')
+        GroupMember.objects.create(group=self.group, user=self.admin, is_admin=True)
+        self.pending = [
+            GroupJoinRequest.objects.create(group=self.group, user=make_user(f'singer{n}')) for n in range(2)
+        ]
+        # Not reviewable by admin: another admin's group, and one already reviewed
+        other = Group.objects.create(creator=make_user('other'), name='Ushers')
+        self.foreign = GroupJoinRequest.objects.create(group=other, user=make_user('usher'))
+        self.reviewed = GroupJoinRequest.objects.create(
+            group=self.group, user=make_user('latecomer'), status='rejected'
+        )
+
+    def review(self, action, request_ids):
+        return self.client.post(f'/api/group-join-requests/{action}/', {'request_ids': request_ids}, format='json')
+
+    def test_rows_outside_the_admins_pending_requests_are_not_found(self):
+        ids = [join_request.id for join_request in self.pending]
+        response = self.review('bulk-approve', ids + [self.foreign.id, self.reviewed.id, 999999])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['approved'], sorted(ids))
+        self.assertEqual(response.data['not_found'], sorted([self.foreign.id, self.reviewed.id, 999999]))
+        self.assertEqual(
+            set(GroupMember.objects.filter(group=self.group, is_admin=False).values_list('user_id', flat=True)),
+            {join_request.user_id for join_request in self.pending}
+        )
+        self.assertEqual(Notification.objects.filter(notification_type='group_join_approved').count(), 2)
+        self.assertEqual(GroupJoinRequest.objects.get(pk=self.foreign.pk).status, 'pending')
+        self.assertEqual(GroupJoinRequest.objects.get(pk=self.reviewed.pk).status, 'rejected')
+
+    def test_rejecting_twice_finds_nothing_the_second_time(self):
+        ids = [join_request.id for join_request in self.pending]
+        self.assertEqual(self.review('bulk-reject', ids).data['rejected'], sorted(ids))
+        response = self.review('bulk-reject', ids)
+        self.assertEqual(response.data, {'rejected': [], 'not_found': sorted(ids)})
+        self.assertFalse(GroupMember.objects.filter(group=self.group, is_admin=False).exists())
+
+    def test_malformed_request_ids_are_400(self):
+        for request_ids in ([], 'all', [1, 'two']):
+            self.assertEqual(self.review('bulk-approve', request_ids).status_code, 400, request_ids)
+
+
+class ProductRatingTests(TestCase):
+    RATING_FIELDS = ['rating_sum', 'rating_count', 'rating_average'] + [f'rating_{n}_count' for n in range(1, 6)]
+
+    def setUp(self):
+        seller = make_user('seller')
+        self.hymnal = make_product(seller, 'Hymnal')
+        self.psalter = make_product(seller, 'Psalter')
+        self.reviewers = [make_user(f'reviewer{n}') for n in range(3)]
+
+    def aggregates(self):
+        return list(Product.objects.order_by('id').values(*self.RATING_FIELDS))
+
+    def assertMatchesRebuild(self):
+        maintained = self.aggregates()
+        Product.rebuild_ratings()
+        self.assertEqual(maintained, self.aggregates())
+
+    def review(self, reviewer, rating, product=None):
+        return ProductReview.objects.create(
+            product=product or self.hymnal, reviewer=reviewer, rating=rating, comment='Lovely'
+        )
+
+    def test_aggregates_match_rebuild_after_add_edit_and_delete(self):
+        first = self.review(self.reviewers[0], 5)
+        self.review(self.reviewers[1], 2)
+        self.review(self.reviewers[2], 4, product=self.psalter)
+        self.assertMatchesRebuild()
+        hymnal = Product.objects.get(pk=self.hymnal.pk)
+        self.assertEqual((hymnal.rating_sum, hymnal.rating_count), (7, 2))
+        self.assertEqual(hymnal.rating_average, Decimal('3.50'))
+
+        first.rating = 1
+        first.save()
+        self.assertMatchesRebuild()
+        self.assertEqual(Product.objects.get(pk=self.hymnal.pk).rating_histogram, {1: 1, 2: 1, 3: 0, 4: 0, 5: 0})
+
+        first.delete()
+        self.assertMatchesRebuild()
+        ProductReview.objects.filter(product=self.hymnal).delete()
+        self.assertMatchesRebuild()
+        self.assertEqual(Product.objects.get(pk=self.hymnal.pk).rating_average, 0)
+
+    def test_saving_an_unchanged_rating_changes_nothing(self):
+        review = self.review(self.reviewers[0], 3)
+        before = self.aggregates()
+        review.comment = 'Still lovely'
+        review.save()
+        self.assertEqual(self.aggregates(), before)
+
+
+class ProductNearSortTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        seller = make_user('seller')
+        # Created far to near, so newest-first would reverse distance order
+        make_product(seller, 'Far', Decimal('10.00'), latitude=-1.40, longitude=36.80)
+        make_product(seller, 'Middle', Decimal('30.00'), latitude=-1.35, longitude=36.80)
+        make_product(seller, 'Near', Decimal('20.00'), latitude=-1.30, longitude=36.80)
+
+    def walk(self, query):
+        url = f'/api/marketplace/products/?near=-1.29,36.80&radius=50&page_size=1{query}'
+        titles = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            titles += [product['title'] for product in response.data['results']]
+            url = response.data['next']
+        return titles
+
+    def test_near_pages_nearest_first(self):
+        self.assertEqual(self.walk(''), ['Near', 'Middle', 'Far'])
+        self.assertEqual(self.walk('&sort=distance'), ['Near', 'Middle', 'Far'])
+
+    def test_near_with_an_explicit_sort_pages_by_that_sort(self):
+        self.assertEqual(self.walk('&sort=price'), ['Far', 'Near', 'Middle'])
+
+    def test_distance_sort_needs_near(self):
+        self.assertEqual(self.client.get('/api/marketplace/products/?sort=distance').status_code, 400)
+
+
+class OrderExportTests(TestCase):
+    def test_csv_cells_that_look_like_formulas_are_quoted(self):
+        seller = make_user('seller')
+        buyer = make_user('@buyer')
+        product = make_product(seller, '=HYPERLINK("http://example.com","Free")')
+        order = Order.objects.create(buyer=buyer, total_amount=Decimal('10.00'), status='PROCESSING')
+        OrderItem.objects.create(order=order, product=product, seller=seller, quantity=1, price_at_purchase=Decimal('10.00'))
+        client = APIClient()
+        client.force_authenticate(seller)
+
+        response = client.get('/api/marketplace/orders/export/')
+        self.assertEqual(response.status_code, 200)
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0]['product'], '\'=HYPERLINK("http://example.com","Free")')
+        self.assertEqual(rows[0]['buyer'], "'@buyer")
+        self.assertEqual(rows[0]['seller'], 'seller')
+        self.assertEqual(rows[0]['unit_price'], '10.00')
+
+
+class StandInThumbnailHandler(BaseHTTPRequestHandler):
+    """Answers like img.youtube.com: only the sizes in `existing` are there"""
+    protocol_version = 'HTTP/1.1'
+    existing = ('hqdefault', 'mqdefault', 'default')
+
+    def do_HEAD(self):
+        self.server.probes.append((self.client_address, self.path))
+        found = self.path.rsplit('/', 1)[-1].removesuffix('.jpg') in self.existing
+        self.send_response(200 if found else 404)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ResolveThumbnailTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInThumbnailHandler)
+        self.server.probes = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        stand_in = override_settings(YOUTUBE_THUMBNAIL_BASE_URL=f'http://127.0.0.1:{self.server.server_port}/vi')
+        stand_in.enable()
+        self.addCleanup(stand_in.disable)
+
+    def test_falls_back_from_maxres_to_hq_on_one_connection(self):
+        self.assertEqual(resolve_thumbnail('abc'), LiveEvent.thumbnail_url('abc', 'hqdefault'))
+        self.assertEqual(
+            [path for _, path in self.server.probes], ['/vi/abc/maxresdefault.jpg', '/vi/abc/hqdefault.jpg']
+        )
+        self.assertEqual(len({address for address, _ in self.server.probes}), 1)
+
+    def test_answer_is_cached(self):
+        url = resolve_thumbnail('abc')
+        probes = len(self.server.probes)
+        self.assertEqual(resolve_thumbnail('abc'), url)
+        self.assertEqual(len(self.server.probes), probes)
+
+    def test_network_errors_are_not_cached(self):
+        with socket.socket() as unused:
+            unused.bind(('127.0.0.1', 0))
+            closed_url = f'http://127.0.0.1:{unused.getsockname()[1]}/vi'
+        with override_settings(YOUTUBE_THUMBNAIL_BASE_URL=closed_url):
+            self.assertIsNone(resolve_thumbnail('abc'))
+        self.assertEqual(resolve_thumbnail('abc'), LiveEvent.thumbnail_url('abc', 'hqdefault'))
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Checkouts racing in real threads, each on its own database connection"""
+
+    def setUp(self):
+        cache.clear()
+        self.seller = make_user('seller')
+
+    def add_to_cart(self, buyer, product, quantity=1):
+        cart, _ = Cart.objects.get_or_create(user=buyer)
+        CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+
+    def race(self, buyers, headers=None):
+        """POST checkout for every buyer at once; returns the responses"""
+        barrier = threading.Barrier(len(buyers))
+        responses = [None] * len(buyers)
+
+        def checkout(index, buyer):
+            client = APIClient()
+            client.force_authenticate(buyer)
+            try:
+                barrier.wait()
+                responses[index] = client.post('/api/marketplace/cart/checkout/', **(headers or {}))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=pair) for pair in enumerate(buyers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return responses
+
+    def test_last_unit_is_sold_once(self):
+        product = make_product(self.seller, 'Last hymnal', quantity=1)
+        buyers = [make_user(f'buyer{n}') for n in range(4)]
+        for buyer in buyers:
+            self.add_to_cart(buyer, product)
+
+        statuses = sorted(response.status_code for response in self.race(buyers))
+        self.assertEqual(statuses, [201, 409, 409, 409])
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 0)
+        self.assertEqual(OrderItem.objects.filter(product=product).count(), 1)
+
+    def test_retried_checkout_replays_the_first_order(self):
+        product = make_product(self.seller, 'Hymnal', quantity=5)
+        buyer = make_user('buyer')
+        self.add_to_cart(buyer, product, quantity=2)
+        client = APIClient()
+        client.force_authenticate(buyer)
+
+        first = client.post('/api/marketplace/cart/checkout/', HTTP_IDEMPOTENCY_KEY='order-1')
+        retry = client.post('/api/marketplace/cart/checkout/', HTTP_IDEMPOTENCY_KEY='order-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data['id'], first.data['id'])
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 3)
+
+    def test_concurrent_retries_create_one_order(self):
+        product = make_product(self.seller, 'Hymnal', quantity=5)
+        buyer = make_user('buyer')
+        self.add_to_cart(buyer, product)
+
+        responses = self.race([buyer] * 4, headers={'HTTP_IDEMPOTENCY_KEY': 'order-1'})
+        self.assertEqual(sorted(response.status_code for response in responses), [200, 200, 200, 201])
+        self.assertEqual(len({response.data['id'] for response in responses}), 1)
+        self.assertEqual(Order.objects.filter(buyer=buyer).count(), 1)
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 4)
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.seller = make_user('seller')
+        self.buyer = make_user('buyer')
+        self.rival = make_user('rival')
+        self.product = make_product(self.seller, 'Hymnal', quantity=3)
+        self.client = APIClient()
+
+    def add_item(self, user, quantity, product=None):
+        self.client.force_authenticate(user)
+        return self.client.post(
+            '/api/marketplace/cart/add-item/',
+            {'product_id': (product or self.product).id, 'quantity': quantity}, format='json'
+        )
+
+    def expire(self, **filters):
+        StockReservation.objects.filter(**filters).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_stock_held_by_another_cart_is_409(self):
+        self.assertEqual(self.add_item(self.rival, 2).status_code, 200)
+        response = self.add_item(self.buyer, 2)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual((response.data['available'], response.data['in_cart']), (1, 0))
+        # A cart's own hold does not count against it
+        self.assertEqual(self.add_item(self.rival, 1).status_code, 200)
+        response = self.add_item(self.buyer, 1)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['available'], 0)
+
+    def test_expired_holds_are_not_counted(self):
+        self.add_item(self.rival, 3)
+        self.assertEqual(StockReservation.held_quantities([self.product.id]), {self.product.id: 3})
+        self.expire()
+        self.assertEqual(StockReservation.held_quantities([self.product.id]), {})
+        self.assertEqual(self.add_item(self.buyer, 3).status_code, 200)
+        self.assertEqual(
+            StockReservation.held_quantities([self.product.id], exclude_cart=Cart.objects.get(user=self.buyer)), {}
+        )
+
+    def test_release_expired_deletes_in_batches(self):
+        for n in range(5):
+            self.add_item(self.buyer, 1, product=make_product(self.seller, f'Psalter {n}'))
+        self.add_item(self.rival, 1)
+        self.expire(cart_item__cart__user=self.buyer)
+        # Three batches of a select and a delete, then the empty select
+        with self.assertNumQueries(7):
+            self.assertEqual(StockReservation.release_expired(batch_size=2), 5)
+        self.assertEqual(list(StockReservation.objects.values_list('product_id', flat=True)), [self.product.id])
+        self.assertEqual(CartItem.objects.filter(cart__user=self.buyer).count(), 5)
+
+
+class ProductBulkEditTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ExchangeRate.load({'EUR': Decimal('2')})
+        self.seller = make_user('seller')
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+        self.hymnal = make_product(self.seller, 'Hymnal', Decimal('10.00'), currency='EUR')
+        self.psalter = make_product(self.seller, 'Psalter', Decimal('8.00'))
+        self.foreign = make_product(make_user('other'), 'Songbook', Decimal('6.00'))
+
+    def bulk_edit(self, rows):
+        return self.client.post('/api/marketplace/products/bulk-update/', {'products': rows}, format='json')
+
+    def test_invalid_duplicate_and_foreign_rows_are_reported_by_index(self):
+        response = self.bulk_edit([
+            {'id': self.hymnal.id, 'price': '30.00'},
+            {'id': self.psalter.id},
+            {'id': self.hymnal.id, 'quantity': 0},
+            {'id': self.foreign.id, 'is_available': False},
+            {'id': 999999, 'price': '1.00'},
+            {'id': self.psalter.id, 'quantity': -1},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], [self.hymnal.id])
+        errors = {error['index']: error for error in response.data['errors']}
+        self.assertEqual(sorted(errors), [1, 2, 3, 4, 5])
+        self.assertIn('non_field_errors', errors[1]['errors'])
+        self.assertEqual(errors[2]['errors'], {'id': ['Listed more than once']})
+        self.assertEqual(errors[3]['errors'], {'id': ['Not one of your products']})
+        self.assertEqual(errors[4]['errors'], {'id': ['Not one of your products']})
+        self.assertIn('quantity', errors[5]['errors'])
+        self.assertTrue(Product.objects.get(pk=self.foreign.pk).is_available)
+
+    def test_price_edits_recompute_the_normalized_price(self):
+        response = self.bulk_edit([
+            {'id': self.hymnal.id, 'price': '30.00'}, {'id': self.psalter.id, 'quantity': 4},
+        ])
+        self.assertEqual(response.data, {'updated': [self.hymnal.id, self.psalter.id], 'errors': []})
+        hymnal = Product.objects.get(pk=self.hymnal.pk)
+        self.assertEqual((hymnal.price, hymnal.price_normalized), (Decimal('30.00'), Decimal('15.00')))
+        psalter = Product.objects.get(pk=self.psalter.pk)
+        self.assertEqual((psalter.quantity, psalter.price_normalized), (4, Decimal('8.00')))
+
+    def test_nothing_applied_is_400(self):
+        self.assertEqual(self.bulk_edit([{'id': self.foreign.id, 'price': '1.00'}]).status_code, 400)
+        self.assertEqual(self.bulk_edit([]).status_code, 400)
+        with override_settings(BULK_EDIT_MAX_ROWS=1):
+            response = self.bulk_edit([{'id': self.hymnal.id, 'quantity': 1}, {'id': self.psalter.id, 'quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+
+
+class MarketplaceQueryCountTests(TestCase):
+    """
+    Pins the queries each marketplace endpoint makes, at two sizes, so a
+    lost select_related/prefetch shows up as a per-row query here
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.seller = make_user('seller')
+        self.buyer = make_user('buyer')
+        self.category = ProductCategory.objects.create(name='Hymnals')
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def add_products(self, count):
+        products = []
+        for n in range(count):
+            product = make_product(self.seller, f'Hymnal {n}', quantity=10, category=self.category)
+            ProductImage.objects.bulk_create([
+                ProductImage(product=product, image='cover'), ProductImage(product=product, image='back')
+            ])
+            self.client.post('/api/marketplace/cart/add-item/', {'product_id': product.id}, format='json')
+            self.client.post('/api/marketplace/wishlist/add-product/', {'product_id': product.id}, format='json')
+            products.append(product)
+        return products
+
+    def assertQueries(self, count, method, url):
+        cache.clear()
+        with self.assertNumQueries(count):
+            response = getattr(self.client, method)(url)
+        self.assertLess(response.status_code, 300)
+        return response
+
+    def test_reads_do_not_grow_with_rows(self):
+        for size in (1, 5):
+            product = self.add_products(size)[0]
+            self.assertQueries(2, 'get', '/api/marketplace/products/')
+            self.assertQueries(2, 'get', f'/api/marketplace/products/{product.slug}/')
+            self.assertQueries(3, 'get', '/api/marketplace/cart/my_cart/')
+            self.assertQueries(3, 'get', '/api/marketplace/wishlist/')
+            # Checking out empties the cart, so the next size starts afresh
+            self.assertQueries(15, 'post', '/api/marketplace/cart/checkout/')
+            self.assertQueries(3, 'get', '/api/marketplace/orders/')
+
+
+class OrderDownloadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for key, value in cloudinary.config().__dict__.copy().items():
+            self.addCleanup(setattr, cloudinary.config(), key, value)
+        cloudinary.config(cloud_name='demo', api_key='key', api_secret='secret')
+        self.seller = make_user('seller')
+        self.buyer = make_user('buyer')
+        track = Track.objects.create(
+            title='Hymn', artist=self.seller, audio_file='video/upload/v1/audio/hymn.mp3'
+        )
+        self.product = make_product(self.seller, 'Hymn download', is_digital=True, track=track)
+        self.orders = [self.make_order() for _ in range(2)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def make_order(self):
+        order = Order.objects.create(buyer=self.buyer, total_amount=Decimal('10.00'), status='DELIVERED')
+        OrderItem.objects.create(
+            order=order, product=self.product, seller=self.seller, quantity=1, price_at_purchase=Decimal('10.00')
+        )
+        return order
+
+    def downloads(self, order):
+        return self.client.get(f'/api/marketplace/orders/{order.pk}/downloads/')
+
+    def test_repeat_taps_come_from_the_cache(self):
+        response = self.downloads(self.orders[0])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([d['product_id'] for d in response.data['downloads']], [self.product.pk])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.downloads(self.orders[0]).status_code, 200)
+
+    def test_unknown_and_other_buyers_orders_are_404(self):
+        self.assertEqual(self.client.get('/api/marketplace/orders/999999/downloads/').status_code, 404)
+        self.client.force_authenticate(self.seller)
+        self.assertEqual(self.downloads(self.orders[0]).status_code, 404)
+
+    def test_refund_revokes_a_cached_entitlement(self):
+        self.assertEqual(self.downloads(self.orders[0]).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.orders[0].status = 'REFUNDED'
+            self.orders[0].save()
+        self.assertEqual(self.downloads(self.orders[0]).status_code, 403)
+
+    def test_bulk_refund_revokes_once_per_buyer_after_commit(self):
+        for order in self.orders:
+            self.assertEqual(self.downloads(order).status_code, 200)
+        version = get_version(DOWNLOADS_NAMESPACE, self.buyer.pk)
+        seller_client = APIClient()
+        seller_client.force_authenticate(self.seller)
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = seller_client.post('/api/marketplace/orders/bulk-update-status/', {
+                'orders': [{'id': order.pk, 'status': 'CANCELLED'} for order in self.orders]
+            }, format='json')
+            self.assertEqual(response.status_code, 200)
+        # Nothing is revoked until the status change commits
+        self.assertEqual(get_version(DOWNLOADS_NAMESPACE, self.buyer.pk), version)
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        for order in self.orders:
+            self.assertEqual(self.downloads(order).status_code, 403)
+
+
+class BufferedCounterTests(TestCase):
+    def setUp(self):
+        artist = make_user('artist')
+        self.track = Track.objects.create(title='Hymn', artist=artist)
+        self.counter = BufferedCounter(Track, 'downloads', flush_every=3, flush_seconds=3600)
+
+    def downloads(self):
+        self.track.refresh_from_db()
+        return self.track.downloads
+
+    def test_flushes_every_n_increments(self):
+        self.counter.add(self.track.pk)
+        self.counter.add(self.track.pk)
+        self.assertEqual(self.downloads(), 0)
+        self.counter.add(self.track.pk)
+        self.assertEqual(self.downloads(), 3)
+
+    def test_pending_counts_are_written_at_exit(self):
+        self.counter.add(self.track.pk, 2)
+        self.counter.flush_at_exit()
+        self.assertEqual(self.downloads(), 2)
+        self.assertEqual(self.counter.flush(), 0)
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.sellers = [make_user('seller'), make_user('reseller')]
+        self.buyer = make_user('buyer')
+        self.products = [make_product(self.sellers[0], f'Hymnal {n}') for n in range(2)]
+
+    def make_order(self, *lines, days_ago=1, status='DELIVERED', currency='USD'):
+        """lines: (product, seller, quantity); backdated past the settle window"""
+        order = Order.objects.create(buyer=self.buyer, total_amount=Decimal('0.00'), status=status)
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order, product=product, seller=seller, quantity=quantity,
+                price_at_purchase=Decimal('10.00'), currency=currency
+            )
+            for product, seller, quantity in lines
+        ])
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+        return order
+
+    def snapshot(self):
+        return {
+            model.__name__: sorted(model.objects.values_list(*model.KEY_FIELDS, 'units', 'revenue', 'order_count'))
+            for model in (SellerDailySales, ProductDailySales)
+        }
+
+    def test_incremental_runs_match_a_rebuild(self):
+        hymnal, songbook = self.products
+        seller, reseller = self.sellers
+        self.make_order((hymnal, seller, 2), (songbook, seller, 1), days_ago=2)
+        # Same product from two sellers in one order
+        self.make_order((hymnal, seller, 1), (hymnal, reseller, 3))
+        self.assertEqual(SalesRollup.run(), 2)
+        self.make_order((songbook, seller, 4), currency='EUR')
+        self.make_order((hymnal, seller, 5), status='CANCELLED')
+        self.assertEqual(SalesRollup.run(), 2)
+        incremental = self.snapshot()
+
+        SalesRollup.run(rebuild=True)
+        self.assertEqual(self.snapshot(), incremental)
+        self.assertIn((hymnal.pk, reseller.pk, (timezone.now() - timedelta(days=1)).date(), 'USD', 3,
+                       Decimal('30.00'), 1), incremental['ProductDailySales'])
+
+    def test_cancelling_a_rolled_up_order_subtracts_it(self):
+        hymnal = self.products[0]
+        self.make_order((hymnal, self.sellers[0], 1))
+        cancelled = self.make_order((hymnal, self.sellers[1], 2), days_ago=3)
+        SalesRollup.run()
+
+        Order.set_statuses({cancelled.pk: 'CANCELLED'})
+        self.assertFalse(SellerDailySales.objects.filter(seller=self.sellers[1]).exists())
+        self.assertFalse(ProductDailySales.objects.filter(seller=self.sellers[1]).exists())
+        row = SellerDailySales.objects.get(seller=self.sellers[0])
+        self.assertEqual((row.units, row.order_count), (1, 1))
+
+        # Undoing it through save() puts it back
+        cancelled.refresh_from_db()
+        cancelled.status = 'DELIVERED'
+        cancelled.save()
+        rolled_up = self.snapshot()
+        SalesRollup.run(rebuild=True)
+        self.assertEqual(self.snapshot(), rolled_up)
+        self.assertEqual(len(rolled_up['SellerDailySales']), 2)
+
+    def test_saving_an_order_does_not_re_read_its_status(self):
+        order = Order.objects.get(pk=self.make_order((self.products[0], self.sellers[0], 1)).pk)
+        order.shipping_address = 'Church Road 1'
+        with self.assertNumQueries(1):
+            order.save()
+
+    def test_settle_window_holds_back_fresh_orders(self):
+        order = self.make_order((self.products[0], self.sellers[0], 1))
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now())
+        self.assertEqual(SalesRollup.run(), 0)
+        self.assertFalse(SellerDailySales.objects.exists())
+
+        Order.objects.filter(pk=order.pk).update(
+            created_at=timezone.now() - timedelta(seconds=settings.SALES_ROLLUP_SETTLE_SECONDS + 1)
+        )
+        self.assertEqual(SalesRollup.run(), 1)
+        self.assertEqual(SellerDailySales.objects.get().units, 1)
+
+
+class SellerStatsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('seller'))
+
+    def stats(self, query):
+        return self.client.get(f'/api/marketplace/seller/stats/?{query}')
+
+    def test_reads_the_rollups(self):
+        response = self.stats('')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['totals'], [])
+
+    def test_invalid_ranges_are_400(self):
+        for query in ('from=yesterday', 'to=2026-02-30', 'from=2026-03-02&to=2026-03-01', 'from=2024-01-01&to=2026-01-01'):
+            self.assertEqual(self.stats(query).status_code, 400, query)
+
+
+class CategoryTreeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.seller = make_user('seller')
+        self.client.force_authenticate(self.seller)
+        self.music = ProductCategory.objects.create(name='Music')
+        self.hymnals = ProductCategory.objects.create(name='Hymnals', parent=self.music)
+        self.choir = ProductCategory.objects.create(name='Choir', parent=self.hymnals)
+
+    def closure(self):
+        return set(ProductCategoryClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+
+    def assertClosureMatchesRebuild(self):
+        maintained = self.closure()
+        ProductCategoryClosure.rebuild()
+        self.assertEqual(maintained, self.closure())
+
+    def counts(self):
+        def walk(nodes):
+            for node in nodes:
+                yield node['name'], node['product_count']
+                yield from walk(node['children'])
+        return dict(walk(self.client.get('/api/marketplace/categories/tree/').data))
+
+    def test_closure_matches_rebuild_after_create_move_and_delete(self):
+        self.assertClosureMatchesRebuild()
+        books = ProductCategory.objects.create(name='Books')
+        self.hymnals.parent = books
+        self.hymnals.save()
+        self.assertClosureMatchesRebuild()
+        self.assertEqual(
+            set(ProductCategoryClosure.subtree(books.id).values_list('descendant_id', flat=True)),
+            {books.id, self.hymnals.id, self.choir.id}
+        )
+        self.hymnals.delete()
+        self.assertClosureMatchesRebuild()
+
+    def test_moving_under_its_own_subtree_is_rejected(self):
+        response = self.client.patch(
+            f'/api/marketplace/categories/{self.music.id}/', {'parent': self.choir.id}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIsNone(ProductCategory.objects.get(pk=self.music.id).parent_id)
+
+    def test_product_listing_changes_refresh_the_counts(self):
+        self.assertEqual(self.counts(), {'Music': 0, 'Hymnals': 0, 'Choir': 0})
+        with self.captureOnCommitCallbacks(execute=True):
+            product = make_product(self.seller, 'Hymnal', category=self.choir)
+        self.assertEqual(self.counts(), {'Music': 1, 'Hymnals': 1, 'Choir': 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.category = self.hymnals
+            product.save()
+        self.assertEqual(self.counts(), {'Music': 1, 'Hymnals': 1, 'Choir': 0})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/marketplace/products/bulk-update/',
+                {'products': [{'id': product.id, 'is_available': False}]}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.counts(), {'Music': 0, 'Hymnals': 0, 'Choir': 0})
+
+        product = Product.objects.get(pk=product.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            product.is_available = True
+            product.save()
+        self.assertEqual(self.counts(), {'Music': 1, 'Hymnals': 1, 'Choir': 0})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        self.assertEqual(self.counts(), {'Music': 0, 'Hymnals': 0, 'Choir': 0})
+
+    def test_unrelated_product_saves_keep_the_cached_tree(self):
+        product = make_product(self.seller, 'Hymnal', category=self.choir)
+        version = get_version(CATEGORY_TREE_NAMESPACE, 'all')
+        product = Product.objects.get(pk=product.pk)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            product.views += 1
+            product.save()
+        self.assertEqual(callbacks, [])
+        self.assertEqual(get_version(CATEGORY_TREE_NAMESPACE, 'all'), version)
+
+    def test_tree_is_invalidated_only_once_the_change_commits(self):
+        self.counts()
+        version = get_version(CATEGORY_TREE_NAMESPACE, 'all')
+        with self.captureOnCommitCallbacks() as callbacks:
+            ProductCategory.objects.create(name='Books')
+            self.assertEqual(get_version(CATEGORY_TREE_NAMESPACE, 'all'), version)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_version(CATEGORY_TREE_NAMESPACE, 'all'), version)
@@ -0,0 +1,95 @@
+"""Background resolution of YouTube thumbnails for live events.
+
+LiveEvent.save stores the placeholder thumbnail, which exists for every
+video, without touching the network. Once the save commits, the best quality
+that actually exists is looked up on a small thread pool and written back.
+Probes share one pooled HTTP session, and their answers are cached per video
+id, so repeated saves and events on the same stream don't probe again.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connection, transaction
+from requests.adapters import HTTPAdapter
+
+from .models import LiveEvent
+
+logger = logging.getLogger(__name__)
+
+_session = None
+_session_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=settings.THUMBNAIL_MAX_WORKERS, thread_name_prefix='thumbnail')
+
+
+def get_session():
+    """The shared keep-alive session every probe goes through"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.THUMBNAIL_HTTP_POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+
+def resolve_thumbnail(video_id):
+    """
+    URL of the best thumbnail that exists for video_id, or None. Answers,
+    including "none exists", are cached for THUMBNAIL_CACHE_TIMEOUT; network
+    errors are not, so the next attempt probes again.
+    """
+    cache_key = f'youtube_thumbnail:{video_id}'
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached or None
+
+    found = ''
+    for quality in LiveEvent.THUMBNAIL_QUALITIES:
+        url = LiveEvent.thumbnail_url(video_id, quality)
+        try:
+            response = get_session().head(url, timeout=settings.THUMBNAIL_HTTP_TIMEOUT)
+        except requests.RequestException as e:
+            logger.warning(f"Thumbnail probe for {video_id} failed: {str(e)}")
+            return None
+        # Missing sizes answer 404 (with a grey placeholder image)
+        if response.status_code == 200:
+            found = url
+            break
+    cache.set(cache_key, found, settings.THUMBNAIL_CACHE_TIMEOUT)
+    return found or None
+
+
+def update_event_thumbnail(event_id, video_id):
+    """Replace the event's placeholder with the best thumbnail, if it still has it"""
+    url = resolve_thumbnail(video_id)
+    if url:
+        # A thumbnail set by hand or a changed URL in the meantime wins
+        LiveEvent.objects.filter(
+            pk=event_id, thumbnail=LiveEvent.thumbnail_url(video_id)
+        ).update(thumbnail=url)
+    return url
+
+
+def _run_update(event_id, video_id):
+    close_old_connections()
+    try:
+        update_event_thumbnail(event_id, video_id)
+    except Exception as e:
+        logger.error(f"Resolving thumbnail of live event {event_id} failed: {str(e)}", exc_info=True)
+    finally:
+        # Worker threads own their connection; don't leave it open between jobs
+        connection.close()
+
+
+def queue_thumbnail_update(event):
+    """Resolve event's thumbnail on the worker pool once the current transaction commits"""
+    video_id = LiveEvent.extract_youtube_id(event.youtube_url)
+    if video_id:
+        event_id = event.pk
+        transaction.on_commit(lambda: _executor.submit(_run_update, event_id, video_id))
@@ -0,0 +1,83 @@
+"""Concurrent Cloudinary uploads.
+
+Uploads are network bound, so requests carrying several files run them on a
+small thread pool instead of one after another. Every upload has its own HTTP
+timeout and failures are collected per file rather than aborting the batch.
+The worker threads never touch the database; callers write rows afterwards.
+"""
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from cloudinary import uploader
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def upload_all(jobs):
+    """
+    Upload {key: (file, options)} concurrently with cloudinary's
+    upload_resource. Returns (resources, errors), both keyed like jobs.
+    """
+    if not jobs:
+        return {}, {}
+    timeout = settings.UPLOAD_TIMEOUT
+    workers = min(settings.UPLOAD_MAX_WORKERS, len(jobs))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='upload')
+    futures = {}
+    for key, (file, options) in jobs.items():
+        if hasattr(file, 'seekable') and file.seekable():
+            file.seek(0)
+        futures[key] = executor.submit(uploader.upload_resource, file, timeout=timeout, **options)
+
+    # The HTTP timeout bounds each upload; this only guards against a hung worker
+    # while queued uploads wait for a free thread
+    wait = timeout * math.ceil(len(jobs) / workers) + timeout
+    resources, errors = {}, {}
+    try:
+        for key, future in futures.items():
+            try:
+                resources[key] = future.result(timeout=wait)
+            except FutureTimeoutError:
+                errors[key] = "Upload timed out"
+            except Exception as e:
+                logger.warning(f"Upload of {key} failed: {str(e)}")
+                errors[key] = str(e)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return resources, errors
+
+
+def field_upload_options(instance, field_name):
+    """The options CloudinaryField.pre_save would upload instance.<field_name> with"""
+    field = instance._meta.get_field(field_name)
+    options = {'type': field.type, 'resource_type': field.resource_type}
+    options.update({
+        key: value(instance) if callable(value) else value
+        for key, value in field.options.items()
+    })
+    return options
+
+
+def upload_to_field(instances, field_name, files):
+    """
+    Upload files[i] into instances[i].<field_name> concurrently. Returns the
+    instances whose upload succeeded, ready for bulk_create, and a list of
+    {'file': name, 'error': message} for the ones that failed.
+    """
+    jobs = {
+        index: (file, field_upload_options(instance, field_name))
+        for index, (instance, file) in enumerate(zip(instances, files))
+    }
+    resources, errors = upload_all(jobs)
+    uploaded = []
+    for index, instance in enumerate(instances):
+        if index in resources:
+            setattr(instance, field_name, resources[index])
+            uploaded.append(instance)
+    failed = [
+        {'file': getattr(files[index], 'name', str(index)), 'error': message}
+        for index, message in sorted(errors.items())
+    ]
+    return uploaded, failed
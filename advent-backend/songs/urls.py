@@ -31,7 +31,10 @@ from .views import (
     LiveEventViewSet,
     AvatarUploadView,
     TrackUploadView,
-    SocialPostUploadView
+    SocialPostUploadView,
+    SellerStatsView,
+    OrderExportView,
+    BootstrapView
 
 
 
@@ -80,6 +83,7 @@ products_router.register(r'reviews', ProductReviewViewSet, basename='product-rev
 urlpatterns = [
     # Existing routes
     path('signup/', SignUpView.as_view(), name='signup'),
+    path('me/bootstrap/', BootstrapView.as_view(), name='me-bootstrap'),
     path('tracks/<int:pk>/download/', TrackViewSet.as_view({'get': 'download'}), name='track-download'),
     path('tracks/upload/', TrackViewSet.as_view({'post': 'upload_track'}), name='track-upload'),
     path('tracks/favorites/', TrackViewSet.as_view({'get': 'get_favorites'}), name='track-favorites'),
@@ -90,6 +94,8 @@ urlpatterns = [
     path('choirs/<int:pk>/add-member/', ChoirViewSet.as_view({'post': 'add_member'}), name='choir-add-member'),
     path('choirs/<int:pk>/toggle-active/', ChoirViewSet.as_view({'post': 'toggle_active'}), name='choir-toggle-active'),
     path('choirs/<int:pk>/update-members/', ChoirViewSet.as_view({'post': 'update_members'}), name='choir-update-members'),
+    path('choirs/<int:pk>/bulk-add-members/', ChoirViewSet.as_view({'post': 'bulk_add_members'}), name='choir-bulk-add-members'),
+    path('choirs/<int:pk>/bulk-remove-members/', ChoirViewSet.as_view({'post': 'bulk_remove_members'}), name='choir-bulk-remove-members'),
     
     
     # New group-related routes
@@ -105,11 +111,26 @@ urlpatterns = [
     path('group-join-requests/<int:pk>/reject/', 
          GroupJoinRequestViewSet.as_view({'post': 'reject_request'}), 
          name='group-join-reject'),
+    path('group-join-requests/bulk-approve/', 
+         GroupJoinRequestViewSet.as_view({'post': 'bulk_approve'}), 
+         name='group-join-bulk-approve'),
+    path('group-join-requests/bulk-reject/', 
+         GroupJoinRequestViewSet.as_view({'post': 'bulk_reject'}), 
+         name='group-join-bulk-reject'),
      path('groups/<slug:slug>/check-membership/', GroupViewSet.as_view({'get': 'check_membership'}), name='group-check-membership'),
+     path('groups/unread-counts/', GroupViewSet.as_view({'get': 'unread_counts'}), name='group-unread-counts'),
+     path('groups/<slug:slug>/unread/', GroupViewSet.as_view({'get': 'unread'}), name='group-unread'),
+     path('groups/<slug:slug>/mark-read/', GroupViewSet.as_view({'post': 'mark_read'}), name='group-mark-read'),
      #     path('groups/<slug:slug>/posts/', 
      #     GroupViewSet.as_view({'get': 'group_posts', 'post': 'group_posts'}), 
      #     name='group-posts'),
 
+     path('marketplace/categories/tree/', 
+         ProductCategoryViewSet.as_view({'get': 'tree'}), 
+         name='product-category-tree'),
+     path('marketplace/products/bulk-update/', 
+         ProductViewSet.as_view({'post': 'bulk_edit'}), 
+         name='product-bulk-update'),
      path('marketplace/products/<slug:slug>/upload-images/', 
          ProductViewSet.as_view({'post': 'upload_images'}), 
          name='product-upload-images'),
@@ -119,6 +140,20 @@ urlpatterns = [
     path('marketplace/cart/checkout/', 
          CartViewSet.as_view({'post': 'checkout'}), 
          name='cart-checkout'),
+    path('marketplace/cart/summary/', 
+         CartViewSet.as_view({'get': 'summary'}), 
+         name='cart-summary'),
+    path('marketplace/cart/badge/', 
+         CartViewSet.as_view({'get': 'badge'}), 
+         name='cart-badge'),
+    path('marketplace/seller/stats/', SellerStatsView.as_view(), name='seller-stats'),
+    path('marketplace/orders/export/', OrderExportView.as_view(), name='order-export'),
+    path('marketplace/orders/bulk-update-status/', 
+         OrderViewSet.as_view({'post': 'bulk_update_status'}), 
+         name='order-bulk-update-status'),
+    path('marketplace/orders/<int:pk>/downloads/', 
+         OrderViewSet.as_view({'get': 'downloads'}), 
+         name='order-downloads'),
     path('marketplace/orders/<int:pk>/update-status/', 
          OrderViewSet.as_view({'post': 'update_status'}), 
          name='order-update-status'),
@@ -145,4 +180,5 @@ urlpatterns = [
 urlpatterns += router.urls 
 urlpatterns += tracks_router.urls 
 urlpatterns += social_posts_router.urls
-urlpatterns += groups_router.urls
\ No newline at end of file
+urlpatterns += groups_router.urls
+urlpatterns += products_router.urls
\ No newline at end of file
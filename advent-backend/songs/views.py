@@ -1,5 +1,7 @@
 from rest_framework import viewsets, permissions
-from django.db.models import Q
+from django.db.models import Q, F, Func, Subquery, OuterRef, Sum, Exists, Count, Case, When, PositiveIntegerField, Prefetch
+from django.db.models.functions import Coalesce, Greatest
+from django.conf import settings
 from rest_framework import serializers
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -9,14 +11,15 @@ from django.contrib.auth.models import User
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, BasePermission
 from rest_framework.permissions import AllowAny
-from django.utils.text import slugify
 from rest_framework.exceptions import ValidationError
 from django.http import FileResponse,Http404
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
 from rest_framework.decorators import api_view, permission_classes
 from django.shortcuts import get_object_or_404 
 from rest_framework.pagination import PageNumberPagination
-from django.db import transaction
+from django.db import transaction, IntegrityError
+from django.contrib.postgres.search import SearchQuery
 from django.contrib.auth.decorators import login_required
 from rest_framework.exceptions import PermissionDenied
 from rest_framework import status
@@ -25,7 +28,12 @@ from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_control
 from cloudinary.uploader import upload
 from cloudinary.exceptions import Error as CloudinaryError
-from .models import User,SocialPost,PostSave,PostComment, PostLike, LiveEvent, Track, Playlist, Profile, Comment, Like, Category, Notification,Church,Videostudio, Choir, Group, GroupMember, GroupJoinRequest, GroupPost,GroupPostAttachment,ProductCategory,ProductImage,Product,CartItem,Cart,OrderItem,Order,ProductReview,Wishlist
+from .models import User,SocialPost,PostSave,PostComment, PostLike, LiveEvent, Track, Playlist, Profile, Comment, Like, Category, Notification,Church,Videostudio, Choir, Group, GroupMember, GroupJoinRequest, GroupPost,GroupPostAttachment,ProductCategory,ProductImage,Product,CartItem,Cart,OrderItem,Order,ProductReview,Wishlist,ChurchFacetCount,VideostudioService,ChoirMembership,ProductCategoryClosure,ExchangeRate,PRODUCT_PRICE_SORT,PRODUCT_SEARCH_VECTOR,SellerDailySales,ProductDailySales,SalesRollup,StockReservation
+from .caching import CATEGORY_TREE_NAMESPACE, GROUP_MEMBERSHIP_NAMESPACE, PUBLIC_GROUPS_NAMESPACE, bump_version, versioned_key
+from .geo import apply_near_filter
+from .pagination import GroupPostCursorPagination, ProductCursorPagination
+from .uploads import upload_all, upload_to_field
+from .downloads import order_downloads, signed_download_url, track_downloads
 from .serializers import (
     UserSerializer,
     TrackSerializer,
@@ -57,13 +65,23 @@ from .serializers import (
     ProductImageSerializer,
     ProductCategorySerializer,
     LiveEventSerializer,
+    UserSummarySerializer,
+    BootstrapJoinRequestSerializer,
+    BootstrapLiveEventSerializer,
     AvatarUploadSerializer,
     TrackUploadSerializer,
-    SocialPostUploadSerializer
+    SocialPostUploadSerializer,
+    ProductBulkEditSerializer,
+    OrderStatusEditSerializer
 )
+import csv
+import itertools
 import logging
+import mimetypes
 import time
+from decimal import Decimal, InvalidOperation
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from datetime import timedelta
 logger = logging.getLogger(__name__)
 
@@ -109,29 +127,32 @@ class TrackUploadView(APIView):
         serializer = TrackUploadSerializer(data=request.data)
         if serializer.is_valid():
             try:
-                # Upload audio file
-                audio_result = upload(
-                    serializer.validated_data['audio_file'],
-                    folder='audio',
-                    resource_type='video',
-                    format='mp3'
-                )
-                
-                # Upload cover image if provided
-                cover_result = None
+                # Upload the audio file and, if provided, the cover image side by side
+                jobs = {
+                    'audio_file': (
+                        serializer.validated_data['audio_file'],
+                        {'folder': 'audio', 'resource_type': 'video', 'format': 'mp3'}
+                    )
+                }
                 if 'cover_image' in serializer.validated_data:
-                    cover_result = upload(
+                    jobs['cover_image'] = (
                         serializer.validated_data['cover_image'],
-                        folder='covers',
-                        resource_type='image'
+                        {'folder': 'covers', 'resource_type': 'image'}
                     )
+                results, upload_errors = upload_all(jobs)
+                if 'audio_file' not in results:
+                    return Response(
+                        {'error': upload_errors['audio_file'], 'upload_errors': upload_errors},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                cover_result = results.get('cover_image')
                 
                 # Create track
                 track_data = {
                     'title': request.data.get('title', 'Untitled Track'),
                     'artist': request.user.id,
-                    'audio_file': audio_result['public_id'],
-                    'cover_image': cover_result['public_id'] if cover_result else None,
+                    'audio_file': results['audio_file'].public_id,
+                    'cover_image': cover_result.public_id if cover_result else None,
                     'album': request.data.get('album', ''),
                     'lyrics': request.data.get('lyrics', '')
                 }
@@ -139,7 +160,10 @@ class TrackUploadView(APIView):
                 track_serializer = TrackSerializer(data=track_data, context={'request': request})
                 if track_serializer.is_valid():
                     track = track_serializer.save()
-                    return Response(track_serializer.data, status=status.HTTP_201_CREATED)
+                    data = track_serializer.data
+                    if upload_errors:
+                        data['upload_errors'] = upload_errors
+                    return Response(data, status=status.HTTP_201_CREATED)
                 return Response(track_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
                 
             except CloudinaryError as e:
@@ -212,6 +236,85 @@ class SignUpView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def _subquery_count(queryset):
+    """Correlated COUNT(*) over queryset, usable as an annotation"""
+    return Coalesce(
+        Subquery(
+            queryset.order_by()
+            .annotate(_count=Func(F('pk'), function='COUNT'))
+            .values('_count')[:1]
+        ),
+        0
+    )
+
+
+class BootstrapView(APIView):
+    """Everything the app needs on launch, in a single round trip"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        cache_key = f'bootstrap:{request.user.pk}'
+        data = cache.get(cache_key)
+        if data is None:
+            data = self.build_payload(request)
+            cache.set(cache_key, data, settings.BOOTSTRAP_CACHE_TIMEOUT)
+        return Response(data, status=status.HTTP_200_OK)
+
+    def build_payload(self, request):
+        user = User.objects.select_related('profile').annotate(
+            unread_count=_subquery_count(
+                Notification.objects.filter(recipient=OuterRef('pk'), read=False)
+            ),
+            cart_item_count=_subquery_count(
+                CartItem.objects.filter(cart__user=OuterRef('pk'))
+            ),
+            pending_join_requests_count=_subquery_count(
+                GroupJoinRequest.objects.filter(
+                    status='pending',
+                    group__members__user=OuterRef('pk'),
+                    group__members__is_admin=True
+                )
+            ),
+        ).get(pk=request.user.pk)
+
+        try:
+            profile = ProfileSerializer(user.profile, context={'request': request}).data
+        except Profile.DoesNotExist:
+            profile = None
+
+        pending_requests = []
+        if user.pending_join_requests_count:
+            pending_requests = GroupJoinRequest.objects.filter(
+                status='pending',
+                group__members__user=user,
+                group__members__is_admin=True
+            ).select_related('group', 'user').order_by('-created_at')[:settings.BOOTSTRAP_JOIN_REQUEST_LIMIT]
+
+        return {
+            'user': {
+                **UserSummarySerializer(user).data,
+                'email': user.email,
+                'bio': user.bio,
+            },
+            'profile_exists': profile is not None,
+            'profile': profile,
+            'unread_notification_count': user.unread_count,
+            'cart_item_count': user.cart_item_count,
+            'pending_join_requests_count': user.pending_join_requests_count,
+            'pending_join_requests': BootstrapJoinRequestSerializer(pending_requests, many=True).data,
+            'live_events': self.live_events(),
+        }
+
+    def live_events(self):
+        # Shared by every user, so cache it once rather than per user
+        events = cache.get('bootstrap:live_events')
+        if events is None:
+            queryset = LiveEvent.objects.filter(is_live=True).select_related('user').order_by('-start_time')
+            events = BootstrapLiveEventSerializer(queryset, many=True).data
+            cache.set('bootstrap:live_events', events, settings.BOOTSTRAP_CACHE_TIMEOUT)
+        return events
+
+
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
@@ -305,14 +408,8 @@ class TrackViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     def perform_create(self, serializer):
-        title = serializer.validated_data.get('title')
-        slug = slugify(title)
-        base_slug = slug
-        counter = 1
-        while Track.objects.filter(slug=slug).exists():
-            slug = f"{base_slug}-{counter}"
-            counter += 1
-        serializer.save(artist=self.request.user, slug=slug)
+        # Track.save allocates the slug
+        serializer.save(artist=self.request.user)
 
     @action(detail=False, methods=['post'], url_path='upload')
     def upload_track(self, request):
@@ -835,6 +932,17 @@ class ChurchViewSet(viewsets.ModelViewSet):
     serializer_class = ChurchSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
+    def hierarchy_filters(self):
+        params = self.request.query_params
+        return {level: params[level] for level in Church.HIERARCHY if params.get(level)}
+
+    def get_queryset(self):
+        queryset = super().get_queryset().select_related('created_by__profile')
+        if self.action == 'list':
+            queryset = queryset.filter(**self.hierarchy_filters())
+            queryset = apply_near_filter(self.request, queryset)
+        return queryset
+
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
@@ -868,6 +976,28 @@ class ChurchViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(churches, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """
+        Church counts at each level of the hierarchy. Each level is counted
+        within the levels selected above it, so ?continent=Africa returns
+        every continent, Africa's countries, and the conferences and
+        districts under Africa.
+        """
+        filters = self.hierarchy_filters()
+        facets = {}
+        for index, level in enumerate(Church.HIERARCHY):
+            ancestors = {
+                field: filters[field]
+                for field in Church.HIERARCHY[:index]
+                if field in filters
+            }
+            rows = ChurchFacetCount.objects.filter(
+                level=level, count__gt=0, **ancestors
+            ).values(level).annotate(total=Sum('count')).order_by(level)
+            facets[level] = [{'value': row[level], 'count': row['total']} for row in rows]
+        return Response({'filters': filters, 'facets': facets})
+
 
 
 
@@ -891,10 +1021,39 @@ class VideoStudioViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         # Add filtering by user if requested
-        user_id = self.request.query_params.get('user_id')
+        params = self.request.query_params
+        user_id = params.get('user_id')
         if user_id:
-            return Videostudio.objects.filter(created_by=user_id)
-        return super().get_queryset()
+            queryset = Videostudio.objects.filter(created_by=user_id)
+        else:
+            queryset = super().get_queryset()
+
+        service_types = [
+            service_type
+            for value in params.getlist('service_type')
+            for service_type in value.split(',') if service_type
+        ]
+        if service_types:
+            invalid = set(service_types) - set(Videostudio.SERVICE_TYPE_CHOICES)
+            if invalid:
+                raise ValidationError({'service_type': f"Invalid service types: {', '.join(sorted(invalid))}"})
+            queryset = queryset.filter(Exists(
+                VideostudioService.objects.filter(studio=OuterRef('pk'), service_type__in=service_types)
+            ))
+
+        verified = params.get('verified')
+        if verified is not None:
+            queryset = queryset.filter(is_verified=verified.lower() in ('true', '1'))
+
+        try:
+            if params.get('min_rate'):
+                queryset = queryset.filter(service_rates__gte=Decimal(params['min_rate']))
+            if params.get('max_rate'):
+                queryset = queryset.filter(service_rates__lte=Decimal(params['max_rate']))
+        except InvalidOperation:
+            raise ValidationError({'rate': 'min_rate and max_rate must be numbers'})
+
+        return apply_near_filter(self.request, queryset)
 
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -937,8 +1096,10 @@ class ChoirViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user_id = self.request.query_params.get('user_id')
         if user_id:
-            return Choir.objects.filter(created_by=user_id)
-        return super().get_queryset()
+            queryset = Choir.objects.filter(created_by=user_id)
+        else:
+            queryset = super().get_queryset()
+        return apply_near_filter(self.request, queryset)
 
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -978,26 +1139,87 @@ class ChoirViewSet(viewsets.ModelViewSet):
         
         try:
             user = User.objects.get(id=user_id)
-        except User.DoesNotExist:
+        except (User.DoesNotExist, ValueError):
             return Response(
                 {"error": "User not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        if choir.members.filter(id=user.id).exists():
+        with transaction.atomic():
+            _, created = ChoirMembership.objects.get_or_create(choir=choir, user=user)
+            if created:
+                Choir.objects.filter(pk=choir.pk).update(members_count=F('members_count') + 1)
+
+        if not created:
             return Response(
                 {"error": "User is already a member of this choir"},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        choir.members.add(user)
-        choir.members_count = choir.members.count()
-        choir.save()
-        
         return Response(
             {"status": "Member added successfully"},
             status=status.HTTP_200_OK
         )
+
+    def _bulk_member_request(self, request):
+        """Shared validation for the bulk membership endpoints"""
+        choir = self.get_object()
+        if choir.created_by != request.user:
+            raise PermissionDenied("Only the creator can manage choir members")
+
+        user_ids = request.data.get('user_ids')
+        if not isinstance(user_ids, list) or not user_ids:
+            raise ValidationError({"user_ids": "A non-empty list of user IDs is required"})
+        try:
+            user_ids = {int(user_id) for user_id in user_ids}
+        except (TypeError, ValueError):
+            raise ValidationError({"user_ids": "User IDs must be integers"})
+        return choir, user_ids
+
+    @action(detail=True, methods=['post'], url_path='bulk-add-members')
+    def bulk_add_members(self, request, pk=None):
+        choir, user_ids = self._bulk_member_request(request)
+
+        with transaction.atomic():
+            # Serialize membership changes for this choir so the count stays exact
+            Choir.objects.select_for_update().filter(pk=choir.pk).first()
+            existing_users = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+            already_members = set(
+                ChoirMembership.objects.filter(choir=choir, user_id__in=existing_users)
+                .values_list('user_id', flat=True)
+            )
+            new_members = existing_users - already_members
+            ChoirMembership.objects.bulk_create([
+                ChoirMembership(choir=choir, user_id=user_id) for user_id in new_members
+            ])
+            if new_members:
+                Choir.objects.filter(pk=choir.pk).update(members_count=F('members_count') + len(new_members))
+
+        choir.refresh_from_db(fields=['members_count'])
+        return Response({
+            "added": sorted(new_members),
+            "already_members": sorted(already_members),
+            "not_found": sorted(user_ids - existing_users),
+            "members_count": choir.members_count,
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['post'], url_path='bulk-remove-members')
+    def bulk_remove_members(self, request, pk=None):
+        choir, user_ids = self._bulk_member_request(request)
+
+        with transaction.atomic():
+            Choir.objects.select_for_update().filter(pk=choir.pk).first()
+            removed, _ = ChoirMembership.objects.filter(choir=choir, user_id__in=user_ids).delete()
+            if removed:
+                Choir.objects.filter(pk=choir.pk).update(
+                    members_count=Greatest(F('members_count') - removed, 0)
+                )
+
+        choir.refresh_from_db(fields=['members_count'])
+        return Response({
+            "removed": removed,
+            "members_count": choir.members_count,
+        }, status=status.HTTP_200_OK)
     
     @action(detail=True, methods=['post'])
     def toggle_active(self, request, pk=None):
@@ -1048,16 +1270,29 @@ class GroupViewSet(viewsets.ModelViewSet):
     lookup_field = 'slug'
     parser_classes = [MultiPartParser, FormParser]
 
+    @staticmethod
+    def with_member_counts(queryset):
+        return queryset.select_related('creator').annotate(
+            member_total=_subquery_count(GroupMember.objects.filter(group=OuterRef('pk')))
+        )
+
     def get_queryset(self):
-        # For authenticated users
-        if self.request.user.is_authenticated:
-            return Group.objects.filter(
-                Q(is_private=False) |  # Show all public groups
-                Q(creator=self.request.user) |  # Show groups user created
-                Q(members__user=self.request.user)  # Show groups user is member of
-            ).distinct().order_by('-created_at')
+        public = self.with_member_counts(Group.objects.filter(is_private=False))
         # For unauthenticated users (if needed)
-        return Group.objects.filter(is_private=False).order_by('-created_at')
+        if not self.request.user.is_authenticated:
+            return public.order_by('-created_at')
+
+        # Groups the user created or belongs to, from the membership cache
+        own_group_ids = list(GroupMember.memberships_for(self.request.user.pk))
+        if not own_group_ids:
+            return public.order_by('-created_at')
+        if self.action == 'list':
+            # UNION of two index scans instead of a join plus DISTINCT
+            own = self.with_member_counts(Group.objects.filter(id__in=own_group_ids))
+            return public.union(own).order_by('-created_at')
+        return self.with_member_counts(
+            Group.objects.filter(Q(is_private=False) | Q(id__in=own_group_ids))
+        ).order_by('-created_at')
 
     def get_permissions(self):
         if self.action in ['update', 'partial_update', 'destroy']:
@@ -1067,12 +1302,8 @@ class GroupViewSet(viewsets.ModelViewSet):
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context['request'] = self.request
-        return context
-
-
-    def get_serializer_context(self):
-        context = super().get_serializer_context()
-        context['request'] = self.request
+        if self.request.user.is_authenticated:
+            context['memberships'] = GroupMember.memberships_for(self.request.user.pk)
         return context
     
     
@@ -1095,7 +1326,23 @@ class GroupViewSet(viewsets.ModelViewSet):
 
     def perform_destroy(self, instance):
         instance.delete()
-        cache.delete('group_list')
+
+    @action(detail=False, methods=['get'])
+    def public(self, request):
+        """Public groups from a cache shared by every viewer, plus the viewer's own flags"""
+        cache_key = versioned_key(PUBLIC_GROUPS_NAMESPACE, 'all')
+        groups = cache.get(cache_key)
+        if groups is None:
+            queryset = self.with_member_counts(Group.objects.filter(is_private=False)).order_by('-created_at')
+            groups = GroupSerializer(queryset, many=True).data
+            cache.set(cache_key, groups, settings.PUBLIC_GROUPS_CACHE_TIMEOUT)
+
+        memberships = GroupMember.memberships_for(request.user.pk)
+        not_a_member = {'is_member': False, 'is_admin': False}
+        return Response([
+            {**group, **memberships.get(group['id'], not_a_member)}
+            for group in groups
+        ])
 
     @action(detail=True, methods=['get'], url_path='members')
     def group_members(self, request, slug=None):
@@ -1183,6 +1430,43 @@ class GroupViewSet(viewsets.ModelViewSet):
             'group_slug': slug  # Include group slug in response for verification
         })
     
+    @action(detail=True, methods=['get'], url_path='unread')
+    def unread(self, request, slug=None):
+        membership = GroupMember.objects.filter(group__slug=slug, user=request.user).first()
+        if membership is None:
+            return Response(
+                {"error": "You are not a member of this group"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        return Response({
+            'group_slug': slug,
+            'unread_count': membership.unread_posts().count(),
+            'last_read_at': membership.last_read_at
+        })
+
+    @action(detail=False, methods=['get'], url_path='unread-counts')
+    def unread_counts(self, request):
+        """Unread badges for every group the user belongs to, in one query"""
+        unread = GroupPost.objects.filter(
+            group_id=OuterRef('group_id'),
+            created_at__gt=Coalesce(OuterRef('last_read_at'), OuterRef('joined_at'))
+        ).exclude(user_id=OuterRef('user_id'))
+        rows = GroupMember.objects.filter(user=request.user).annotate(
+            unread_count=_subquery_count(unread)
+        ).values_list('group__slug', 'unread_count')
+        return Response(dict(rows))
+
+    @action(detail=True, methods=['post'], url_path='mark-read')
+    def mark_read(self, request, slug=None):
+        now = timezone.now()
+        updated = GroupMember.objects.filter(group__slug=slug, user=request.user).update(last_read_at=now)
+        if not updated:
+            return Response(
+                {"error": "You are not a member of this group"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        return Response({'group_slug': slug, 'unread_count': 0, 'last_read_at': now})
+
     @action(detail=True, methods=['post'], url_path='upload-cover')
     def upload_cover(self, request, slug=None):
         group = self.get_object()
@@ -1227,11 +1511,19 @@ class GroupPostViewSet(viewsets.ModelViewSet):
     serializer_class = GroupPostSerializer
     permission_classes = [IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser]
+    pagination_class = GroupPostCursorPagination
 
     def get_queryset(self):
-        group_slug = self.kwargs.get('group_slug')
-        group = get_object_or_404(Group, slug=group_slug)
-        return super().get_queryset().filter(group=group).order_by('-created_at')
+        # Filter through the slug join rather than fetching the group first
+        return super().get_queryset().filter(
+            group__slug=self.kwargs.get('group_slug')
+        ).select_related('user').prefetch_related('attachments').order_by('-created_at')
+
+    def list(self, request, *args, **kwargs):
+        # The join alone can't tell an unknown group from one with no posts
+        if not Group.objects.filter(slug=self.kwargs.get('group_slug')).exists():
+            raise Http404("No Group matches the given query.")
+        return super().list(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         group_slug = self.kwargs.get('group_slug')
@@ -1240,10 +1532,10 @@ class GroupPostViewSet(viewsets.ModelViewSet):
         if not GroupMember.objects.filter(group=group, user=self.request.user).exists():
             raise PermissionDenied("You are not a member of this group")
         
-        post = serializer.save(user=self.request.user, group=group)
-        
-        # Handle attachments
-        for file in self.request.FILES.getlist('attachments'):
+        # Handle attachments: upload them all concurrently before writing any rows
+        files = self.request.FILES.getlist('attachments')
+        attachments = []
+        for file in files:
             mime_type, _ = mimetypes.guess_type(file.name)
             file_type = 'document'
             if mime_type:
@@ -1253,12 +1545,14 @@ class GroupPostViewSet(viewsets.ModelViewSet):
                     file_type = 'video'
                 elif mime_type.startswith('audio/'):
                     file_type = 'audio'
-            
-            GroupPostAttachment.objects.create(
-                post=post,
-                file=file,
-                file_type=file_type
-            )
+            attachments.append(GroupPostAttachment(file_type=file_type))
+        attachments, upload_errors = upload_to_field(attachments, 'file', files)
+
+        post = serializer.save(user=self.request.user, group=group)
+        for attachment in attachments:
+            attachment.post = post
+        GroupPostAttachment.objects.bulk_create(attachments)
+        post.upload_errors = upload_errors
         return post  # Make sure to return the post object
 
     def create(self, request, *args, **kwargs):
@@ -1270,8 +1564,11 @@ class GroupPostViewSet(viewsets.ModelViewSet):
         
         # Serialize the complete post with attachments
         complete_serializer = self.get_serializer(post)
-        headers = self.get_success_headers(complete_serializer.data)
-        return Response(complete_serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+        data = complete_serializer.data
+        if post.upload_errors:
+            data['upload_errors'] = post.upload_errors
+        headers = self.get_success_headers(data)
+        return Response(data, status=status.HTTP_201_CREATED, headers=headers)
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -1333,33 +1630,192 @@ class GroupJoinRequestViewSet(viewsets.ModelViewSet):
         
         return Response({"status": "Request rejected"}, status=status.HTTP_200_OK)
 
+    def _bulk_review(self, request, new_status):
+        """
+        Approve or reject many pending requests at once. Admin rights are
+        checked in the same query that loads the requests: ids outside the
+        groups the user administers come back as not_found.
+        """
+        request_ids = request.data.get('request_ids')
+        if not isinstance(request_ids, list) or not request_ids:
+            raise ValidationError({"request_ids": "A non-empty list of request IDs is required"})
+        try:
+            request_ids = {int(request_id) for request_id in request_ids}
+        except (TypeError, ValueError):
+            raise ValidationError({"request_ids": "Request IDs must be integers"})
+
+        with transaction.atomic():
+            join_requests = list(
+                self.get_queryset().filter(id__in=request_ids)
+                .select_for_update(of=('self',))
+                .select_related('group')
+            )
+            reviewed_ids = [join_request.id for join_request in join_requests]
+            if new_status == 'approved':
+                GroupMember.objects.bulk_create([
+                    GroupMember(group_id=join_request.group_id, user_id=join_request.user_id)
+                    for join_request in join_requests
+                ], ignore_conflicts=True)
+            GroupJoinRequest.objects.filter(id__in=reviewed_ids).update(status=new_status)
+            verb = 'approved' if new_status == 'approved' else 'declined'
+            Notification.objects.bulk_create([
+                Notification(
+                    recipient_id=join_request.user_id,
+                    sender=request.user,
+                    message=f"Your request to join {join_request.group.name} was {verb}",
+                    notification_type=f'group_join_{new_status}'
+                )
+                for join_request in join_requests
+            ])
+
+        if new_status == 'approved' and join_requests:
+            # bulk_create skips the post_save receivers that invalidate these
+            for join_request in join_requests:
+                bump_version(GROUP_MEMBERSHIP_NAMESPACE, join_request.user_id)
+            bump_version(PUBLIC_GROUPS_NAMESPACE, 'all')
+
+        return Response({
+            new_status: sorted(reviewed_ids),
+            "not_found": sorted(request_ids - set(reviewed_ids)),
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='bulk-approve')
+    def bulk_approve(self, request):
+        return self._bulk_review(request, 'approved')
+
+    @action(detail=False, methods=['post'], url_path='bulk-reject')
+    def bulk_reject(self, request):
+        return self._bulk_review(request, 'rejected')
+
+
 
 
 
 
+def validate_bulk_rows(rows, serializer_class):
+    """
+    Validate a bulk edit payload row by row. Returns {id: (index, data)} for
+    the valid rows and a list of {"index", "id", "errors"} for the rest.
+    """
+    if not isinstance(rows, list) or not rows:
+        raise ValidationError({"error": "Expected a non-empty list of rows"})
+    if len(rows) > settings.BULK_EDIT_MAX_ROWS:
+        raise ValidationError({"error": f"At most {settings.BULK_EDIT_MAX_ROWS} rows per request"})
+    edits, errors = {}, []
+    for index, row in enumerate(rows):
+        serializer = serializer_class(data=row)
+        row_id = row.get('id') if isinstance(row, dict) else None
+        if not serializer.is_valid():
+            errors.append({"index": index, "id": row_id, "errors": serializer.errors})
+        elif serializer.validated_data['id'] in edits:
+            errors.append({"index": index, "id": row_id, "errors": {"id": ["Listed more than once"]}})
+        else:
+            edits[serializer.validated_data['id']] = (index, serializer.validated_data)
+    return edits, errors
+
+def bulk_result(updated_ids, errors):
+    """Response for a bulk edit: 200 if anything was applied, otherwise 400"""
+    return Response(
+        {"updated": sorted(updated_ids), "errors": sorted(errors, key=lambda error: error["index"])},
+        status=status.HTTP_200_OK if updated_ids else status.HTTP_400_BAD_REQUEST
+    )
 
 # Add to existing views.py
 class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all().order_by('-created_at')
+    queryset = ProductSerializer.setup_eager_loading(Product.objects.all()).order_by('-created_at')
     serializer_class = ProductSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     lookup_field = 'slug'
+    pagination_class = ProductCursorPagination
+    # ?sort= values; trailing id keeps cursor positions stable between equal values
+    SORT_ORDERINGS = {
+        'newest': ('-created_at', '-id'),
+        # Normalized to BASE_CURRENCY so mixed-currency listings sort sensibly,
+        # see PRODUCT_PRICE_SORT
+        'price': ('price_sort', 'id'),
+        '-price': ('-price_sort', '-id'),
+        'popular': ('-views', '-id'),
+        'top_rated': ('-rating_average', '-id'),
+        # Only with ?near=, where it is the default
+        'distance': ('distance', 'id'),
+    }
+
+    def get_sort_ordering(self):
+        params = self.request.query_params
+        sort = params.get('sort') or ('distance' if params.get('near') else 'newest')
+        if sort not in self.SORT_ORDERINGS:
+            raise ValidationError({'sort': f"Sort must be one of: {', '.join(self.SORT_ORDERINGS)}"})
+        if sort == 'distance' and not params.get('near'):
+            raise ValidationError({'sort': "Sorting by distance needs near=<latitude>,<longitude>"})
+        return self.SORT_ORDERINGS[sort]
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        seller_id = self.request.query_params.get('seller')
+        queryset = Product.with_availability(super().get_queryset())
+        params = self.request.query_params
+        seller_id = params.get('seller')
         if seller_id:
             try:
                 queryset = queryset.filter(seller__id=seller_id)
             except ValueError:
                 logger.warning(f"Invalid seller ID: {seller_id}")
                 return queryset.none()
-        return queryset
+        if self.action != 'list':
+            return apply_near_filter(self.request, queryset)
+
+        category = params.get('category')
+        if category:
+            # Matches the category and everything below it
+            category_id = category if category.isdigit() else ProductCategory.objects.filter(
+                name__iexact=category
+            ).values_list('id', flat=True).first()
+            if category_id is None:
+                return queryset.none()
+            queryset = queryset.filter(category_id__in=ProductCategoryClosure.subtree(int(category_id)))
+
+        # Price bounds are in ?currency= when given, otherwise in BASE_CURRENCY
+        price_field = 'price' if params.get('currency') else 'price_normalized'
+        try:
+            if params.get('min_price'):
+                queryset = queryset.filter(**{f'{price_field}__gte': Decimal(params['min_price'])})
+            if params.get('max_price'):
+                queryset = queryset.filter(**{f'{price_field}__lte': Decimal(params['max_price'])})
+        except InvalidOperation:
+            raise ValidationError({'price': 'min_price and max_price must be numbers'})
+
+        condition = params.get('condition')
+        if condition:
+            if condition.upper() not in dict(Product.CONDITION_CHOICES):
+                raise ValidationError({'condition': f"Invalid condition: {condition}"})
+            queryset = queryset.filter(condition=condition.upper())
+        if params.get('currency'):
+            queryset = queryset.filter(currency=params['currency'].upper())
+        for flag in ('is_digital', 'is_available'):
+            value = params.get(flag)
+            if value is not None:
+                queryset = queryset.filter(**{flag: value.lower() in ('true', '1')})
+        if params.get('location'):
+            queryset = queryset.filter(location__icontains=params['location'])
+
+        search = params.get('search', '').strip()
+        if search:
+            # Same expression as product_search_idx so Postgres can use the index
+            queryset = queryset.annotate(search_document=PRODUCT_SEARCH_VECTOR).filter(
+                search_document=SearchQuery(search, config='english', search_type='websearch')
+            )
+
+        # Annotates distance; the ordering below replaces its nearest-first one
+        queryset = apply_near_filter(self.request, queryset)
+        ordering = self.get_sort_ordering()
+        if ordering[0].lstrip('-') == 'price_sort':
+            queryset = queryset.annotate(price_sort=PRODUCT_PRICE_SORT[ordering[0].startswith('-')])
+        return queryset.order_by(*ordering)
 
     def list(self, request, *args, **kwargs):
         try:
             logger.debug(f"Listing products with query params: {request.query_params}")
             return super().list(request, *args, **kwargs)
+        except ValidationError:
+            raise
         except Exception as e:
             logger.error(f"Error listing products: {str(e)}", exc_info=True)
             return Response(
@@ -1400,12 +1856,19 @@ class ProductViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_403_FORBIDDEN
                 )
             images = request.FILES.getlist('images')
-            for image in images:
-                ProductImage.objects.create(product=product, image=image)
-            return Response(
-                {"status": "Images uploaded successfully"},
-                status=status.HTTP_201_CREATED
+            uploaded, upload_errors = upload_to_field(
+                [ProductImage(product=product) for _ in images], 'image', images
             )
+            ProductImage.objects.bulk_create(uploaded)
+            if upload_errors and not uploaded:
+                return Response(
+                    {"error": "No images could be uploaded", "upload_errors": upload_errors},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            response = {"status": "Images uploaded successfully", "uploaded": len(uploaded)}
+            if upload_errors:
+                response["upload_errors"] = upload_errors
+            return Response(response, status=status.HTTP_201_CREATED)
         except Exception as e:
             logger.error(f"Error uploading images: {str(e)}", exc_info=True)
             return Response(
@@ -1413,23 +1876,98 @@ class ProductViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['post'], url_path='bulk-update')
+    def bulk_edit(self, request):
+        """
+        Apply {"products": [{"id", "price", "quantity", "is_available"}, ...]}
+        to the seller's own products with one bulk_update. Rows that are
+        invalid or not the seller's are reported in "errors".
+        """
+        edits, errors = validate_bulk_rows(request.data.get('products'), ProductBulkEditSerializer)
+        now = timezone.now()
+        with transaction.atomic():
+            products = list(Product.objects.select_for_update().filter(
+                seller=request.user, id__in=edits
+            ).order_by('id'))
+            fields = {'updated_at'}
+            for product in products:
+                index, data = edits.pop(product.id)
+                for field, value in data.items():
+                    setattr(product, field, value)
+                    fields.add(field)
+                if 'price' in data:
+                    product.price_normalized = ExchangeRate.normalize(product.price, product.currency)
+                    fields.add('price_normalized')
+                product.updated_at = now
+            fields.discard('id')
+            Product.objects.bulk_update(products, sorted(fields))
+            if 'is_available' in fields:
+                # bulk_update skips the Product signal receivers that do this
+                transaction.on_commit(lambda: bump_version(CATEGORY_TREE_NAMESPACE, 'all'))
+        errors.extend(
+            {"index": index, "id": product_id, "errors": {"id": ["Not one of your products"]}}
+            for product_id, (index, data) in edits.items()
+        )
+        return bulk_result([product.id for product in products], errors)
+
 class ProductCategoryViewSet(viewsets.ModelViewSet):
     queryset = ProductCategory.objects.all()
     serializer_class = ProductCategorySerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        """
+        The whole category tree, nested, with the number of available products
+        under each category. Shared by every viewer from one cache entry, which
+        category changes and product listing changes invalidate.
+        """
+        cache_key = versioned_key(CATEGORY_TREE_NAMESPACE, 'all')
+        tree = cache.get(cache_key)
+        if tree is None:
+            product_counts = dict(
+                ProductCategoryClosure.objects.filter(descendant__products__is_available=True)
+                .values('ancestor_id')
+                .annotate(total=Count('descendant__products'))
+                .values_list('ancestor_id', 'total')
+            )
+            nodes = {}
+            for category in ProductCategory.objects.values('id', 'name', 'description', 'icon', 'parent_id'):
+                nodes[category['id']] = {
+                    **category,
+                    'product_count': product_counts.get(category['id'], 0),
+                    'children': [],
+                }
+            tree = []
+            for node in nodes.values():
+                parent = nodes.get(node['parent_id'])
+                (parent['children'] if parent else tree).append(node)
+            cache.set(cache_key, tree, settings.CATEGORY_TREE_CACHE_TIMEOUT)
+        return Response(tree)
+
+def with_order_items(queryset):
+    """Orders with their buyer, items and the items' products loaded for OrderSerializer"""
+    return queryset.select_related('buyer').prefetch_related(Prefetch(
+        'items', queryset=ProductSerializer.setup_eager_loading(OrderItem.objects.all(), 'product__')
+    ))
+
 class CartViewSet(viewsets.ModelViewSet):
     serializer_class = CartSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return Cart.objects.filter(user=self.request.user)
+        return Cart.objects.filter(user=self.request.user).prefetch_related(Prefetch(
+            'items', queryset=ProductSerializer.setup_eager_loading(
+                CartItem.objects.select_related('reservation'), 'product__'
+            )
+        ))
     def destroy(self, request, *args, **kwargs):
         # Handle DELETE requests for cart items
         try:
             item_id = kwargs.get('pk')
             cart_item = CartItem.objects.get(id=item_id, cart__user=request.user)
             cart_item.delete()
+            Cart.invalidate_badge(request.user.pk)
             return Response(status=status.HTTP_204_NO_CONTENT)
         except CartItem.DoesNotExist:
             return Response(
@@ -1438,84 +1976,248 @@ class CartViewSet(viewsets.ModelViewSet):
             )
     @action(detail=False, methods=['get'])
     def my_cart(self, request):
-        cart = get_object_or_404(Cart, user=request.user)
+        cart = get_object_or_404(self.get_queryset())
         serializer = self.get_serializer(cart)
         return Response(serializer.data)
     
     @action(detail=False, methods=['post'])
     def add_item(self, request):
         product_id = request.data.get('product_id')
-        quantity = request.data.get('quantity', 1)
-        
         try:
-            product = Product.objects.get(id=product_id)
-        except Product.DoesNotExist:
+            quantity = int(request.data.get('quantity', 1))
+        except (TypeError, ValueError):
+            quantity = 0
+        if quantity < 1:
             return Response(
-                {"error": "Product not found"},
-                status=status.HTTP_404_NOT_FOUND
+                {"error": "Quantity must be a positive integer"},
+                status=status.HTTP_400_BAD_REQUEST
             )
         
         cart, created = Cart.objects.get_or_create(user=request.user)
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            product=product,
-            defaults={'quantity': quantity}
-        )
-        
-        if not created:
-            cart_item.quantity += int(quantity)
-            cart_item.save()
+        with transaction.atomic():
+            # The product row lock serializes reservations of the same stock
+            product = Product.objects.select_for_update().filter(id=product_id).first()
+            if product is None:
+                return Response(
+                    {"error": "Product not found"},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            cart_item = CartItem.objects.filter(cart=cart, product=product).first()
+            in_cart = cart_item.quantity if cart_item else 0
+            held = StockReservation.held_quantities([product.id], exclude_cart=cart).get(product.id, 0)
+            available = max(product.quantity - held, 0)
+            if in_cart + quantity > available:
+                return Response(
+                    {"error": "Not enough stock available", "available": available, "in_cart": in_cart},
+                    status=status.HTTP_409_CONFLICT
+                )
+
+            if cart_item:
+                cart_item.quantity = in_cart + quantity
+                cart_item.save(update_fields=['quantity'])
+            else:
+                cart_item = CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+            reservation = StockReservation.hold(cart_item)
+        Cart.invalidate_badge(request.user.pk)
         
         return Response(
-            {"status": "Item added to cart"},
+            {"status": "Item added to cart", "reserved_until": reservation.expires_at},
             status=status.HTTP_200_OK
         )
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        summary = Cart.summary(request.user.pk)
+        for row in summary['subtotals']:
+            row['subtotal'] = f"{row['subtotal']:.2f}"
+        return Response(summary)
+
+    @action(detail=False, methods=['get'])
+    def badge(self, request):
+        return Response({'count': Cart.badge_count(request.user.pk)})
     
     @action(detail=False, methods=['post'])
     def checkout(self, request):
+        idempotency_key = request.headers.get('Idempotency-Key') or None
+        if idempotency_key:
+            if len(idempotency_key) > 255:
+                return Response(
+                    {"error": "Idempotency-Key must be at most 255 characters"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            # A retried checkout returns the order its first attempt created
+            existing = with_order_items(
+                Order.objects.filter(buyer=request.user, idempotency_key=idempotency_key)
+            ).first()
+            if existing:
+                return self._replayed_order(request, existing)
+
         cart = get_object_or_404(Cart, user=request.user)
-        
-        if cart.items.count() == 0:
-            return Response(
-                {"error": "Your cart is empty"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        with transaction.atomic():
-            order = Order.objects.create(
-                buyer=request.user,
-                status='PENDING',
-                total_amount=sum(item.product.price * item.quantity for item in cart.items.all())
-            )
-            
-            for item in cart.items.all():
-                OrderItem.objects.create(
-                    order=order,
-                    product=item.product,
-                    quantity=item.quantity,
-                    price_at_purchase=item.product.price,
-                    seller=item.product.seller
+        try:
+            with transaction.atomic():
+                items = list(cart.items.order_by('product_id'))
+                if not items:
+                    # A concurrent attempt with the same key may have just emptied the cart
+                    existing = idempotency_key and with_order_items(
+                        Order.objects.filter(buyer=request.user, idempotency_key=idempotency_key)
+                    ).first()
+                    if existing:
+                        return self._replayed_order(request, existing)
+                    return Response(
+                        {"error": "Your cart is empty"},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+
+                # Lock the products in id order so concurrent checkouts can't deadlock
+                products = {
+                    product.id: product
+                    for product in Product.objects.select_for_update().filter(
+                        id__in=[item.product_id for item in items]
+                    ).order_by('id')
+                }
+                # Stock other carts hold can't be bought; this cart's own holds can
+                held = StockReservation.held_quantities(list(products), exclude_cart=cart)
+                available = {
+                    product_id: max(product.quantity - held.get(product_id, 0), 0)
+                    for product_id, product in products.items()
+                }
+                unavailable = [
+                    {
+                        "product_id": item.product_id,
+                        "requested": item.quantity,
+                        "available": available[item.product_id],
+                    }
+                    for item in items if available[item.product_id] < item.quantity
+                ]
+                if unavailable:
+                    return Response(
+                        {"error": "Some items are out of stock", "unavailable": unavailable},
+                        status=status.HTTP_409_CONFLICT
+                    )
+
+                order = Order.objects.create(
+                    buyer=request.user,
+                    status='PENDING',
+                    total_amount=sum(products[item.product_id].price * item.quantity for item in items),
+                    idempotency_key=idempotency_key
                 )
-                
-                # Update product quantity
-                item.product.quantity -= item.quantity
-                item.product.save()
-            
-            # Clear the cart
-            cart.items.all().delete()
+                OrderItem.objects.bulk_create([
+                    OrderItem(
+                        order=order,
+                        product_id=item.product_id,
+                        quantity=item.quantity,
+                        price_at_purchase=products[item.product_id].price,
+                        currency=products[item.product_id].currency,
+                        seller_id=products[item.product_id].seller_id
+                    )
+                    for item in items
+                ])
+
+                # One UPDATE for all stock; each row only matches if it can't go negative
+                in_stock = Q()
+                for item in items:
+                    in_stock |= Q(id=item.product_id, quantity__gte=item.quantity)
+                updated = Product.objects.filter(in_stock).update(quantity=Case(
+                    *[When(id=item.product_id, then=F('quantity') - item.quantity) for item in items],
+                    output_field=PositiveIntegerField()
+                ))
+                if updated != len(items):
+                    transaction.set_rollback(True)
+                    return Response(
+                        {"error": "Stock changed during checkout, please try again"},
+                        status=status.HTTP_409_CONFLICT
+                    )
+
+                # Clear the cart
+                CartItem.objects.filter(id__in=[item.id for item in items]).delete()
+                transaction.on_commit(lambda: Cart.invalidate_badge(request.user.pk))
+            order = with_order_items(Order.objects.filter(pk=order.pk)).get()
+        except IntegrityError:
+            # A concurrent retry with the same key committed first
+            existing = with_order_items(
+                Order.objects.filter(buyer=request.user, idempotency_key=idempotency_key)
+            ).first()
+            if idempotency_key and existing:
+                return self._replayed_order(request, existing)
+            raise
         
         return Response(
             OrderSerializer(order, context={'request': request}).data,
             status=status.HTTP_201_CREATED
         )
 
+    def _replayed_order(self, request, order):
+        response = Response(
+            OrderSerializer(order, context={'request': request}).data,
+            status=status.HTTP_200_OK
+        )
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
 class OrderViewSet(viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return Order.objects.filter(Q(buyer=self.request.user) | Q(items__seller=self.request.user)).distinct()
+        # EXISTS instead of joining items, so no DISTINCT over whole orders
+        sold = Exists(OrderItem.objects.filter(order=OuterRef('pk'), seller=self.request.user))
+        return with_order_items(Order.objects.filter(Q(buyer=self.request.user) | sold))
     
+    @action(detail=False, methods=['post'], url_path='bulk-update-status')
+    def bulk_update_status(self, request):
+        """
+        Apply {"orders": [{"id", "status"}, ...]} to orders the user sells
+        items in, checked with one query and written with one UPDATE.
+        """
+        edits, errors = validate_bulk_rows(request.data.get('orders'), OrderStatusEditSerializer)
+        updated = Order.set_statuses(
+            {order_id: data['status'] for order_id, (index, data) in edits.items()},
+            orders=Order.objects.filter(Exists(OrderItem.objects.filter(order=OuterRef('pk'), seller=request.user)))
+        )
+        errors.extend(
+            {"index": index, "id": order_id, "errors": {"id": ["Not an order you sell items in"]}}
+            for order_id, (index, data) in edits.items() if order_id not in updated
+        )
+        return bulk_result(updated, errors)
+
+    @action(detail=True, methods=['get'])
+    def downloads(self, request, pk=None):
+        """
+        Signed, expiring download URLs for the digital tracks bought in this
+        order, or just ?product=<id>. Entitlements come from the cache after
+        the first call, so repeated taps don't query orders.
+        """
+        try:
+            entitlements = order_downloads(request.user.pk, int(pk))
+        except PermissionError:
+            return Response(
+                {"error": "Downloads are not available for cancelled or refunded orders"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        if entitlements is None:
+            return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        product_id = request.query_params.get('product')
+        if product_id:
+            entitlements = [e for e in entitlements if str(e['product_id']) == product_id]
+            if not entitlements:
+                return Response(
+                    {"error": "This product has no download in this order"},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+
+        downloads = []
+        for entitlement in entitlements:
+            url, expires_at = signed_download_url(entitlement)
+            track_downloads.add(entitlement['track_id'])
+            downloads.append({
+                "product_id": entitlement['product_id'],
+                "title": entitlement['title'],
+                "url": url,
+                "expires_at": expires_at,
+            })
+        return Response({"order_id": int(pk), "downloads": downloads})
+
     @action(detail=True, methods=['post'])
     def update_status(self, request, pk=None):
         order = self.get_object()
@@ -1528,8 +2230,7 @@ class OrderViewSet(viewsets.ModelViewSet):
             )
         
         if order.items.filter(seller=request.user).exists() or order.buyer == request.user:
-            order.status = new_status
-            order.save()
+            Order.set_statuses({order.pk: new_status})
             return Response(
                 {"status": "Order status updated"},
                 status=status.HTTP_200_OK
@@ -1540,26 +2241,194 @@ class OrderViewSet(viewsets.ModelViewSet):
             status=status.HTTP_403_FORBIDDEN
         )
 
+def parse_day_param(request, param):
+    """?<param>=YYYY-MM-DD as a date, None if absent; a 400 if malformed"""
+    value = request.query_params.get(param)
+    if not value:
+        return None
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise ValidationError({param: "Expected a date as YYYY-MM-DD"})
+    return day
+
+class SellerStatsView(APIView):
+    """
+    Sales totals, a daily series and top products for the current seller
+    between ?from= and ?to= (inclusive dates, default the last 30 days).
+    Reads only the daily rollups, so orders placed since the last
+    SalesRollup run are not counted yet.
+    """
+    permission_classes = [IsAuthenticated]
+    DEFAULT_DAYS = 30
+    MAX_DAYS = 366
+    TOP_PRODUCTS = 10
+
+    def get(self, request):
+        to_day = parse_day_param(request, 'to') or timezone.localdate()
+        from_day = parse_day_param(request, 'from') or to_day - timedelta(days=self.DEFAULT_DAYS - 1)
+        if from_day > to_day:
+            return Response({"error": "'from' must not be after 'to'"}, status=status.HTTP_400_BAD_REQUEST)
+        if (to_day - from_day).days >= self.MAX_DAYS:
+            return Response(
+                {"error": f"Date range can span at most {self.MAX_DAYS} days"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        days = SellerDailySales.objects.filter(seller=request.user, day__range=(from_day, to_day))
+        totals = days.order_by('currency').values('currency').annotate(
+            units=Sum('units'), revenue=Sum('revenue'), order_count=Sum('order_count')
+        )
+        top_products = ProductDailySales.objects.filter(
+            seller=request.user, day__range=(from_day, to_day)
+        ).values('product_id', 'product__title', 'product__slug', 'currency').annotate(
+            units=Sum('units'), revenue=Sum('revenue')
+        ).order_by('-units', '-revenue')[:self.TOP_PRODUCTS]
+        rolled_up = SalesRollup.objects.filter(pk=1).values_list('updated_at', flat=True).first()
+
+        return Response({
+            "from": from_day,
+            "to": to_day,
+            "totals": list(totals),
+            "daily": list(days.values('day', 'currency', 'units', 'revenue', 'order_count')),
+            "top_products": [
+                {
+                    "product_id": row['product_id'],
+                    "title": row['product__title'],
+                    "slug": row['product__slug'],
+                    "currency": row['currency'],
+                    "units": row['units'],
+                    "revenue": row['revenue'],
+                }
+                for row in top_products
+            ],
+            "rolled_up_at": rolled_up,
+        })
+
+class Echo:
+    """File-like object whose write() hands the line back, for streaming csv.writer output"""
+    def write(self, value):
+        return value
+
+# Leading characters that make spreadsheet apps treat a cell as a formula
+CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+def csv_safe(value):
+    """value with a leading quote if it is text a spreadsheet would run as a formula"""
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+class OrderExportView(APIView):
+    """
+    Streams order lines as CSV (default) or NDJSON (?output=ndjson): one row
+    per order item with its order's fields alongside. ?role=seller (default)
+    exports the user's sales, ?role=buyer their purchases and staff may use
+    ?role=all; ?from= and ?to= bound the order date. Rows come from a flat
+    values() projection read in chunks, so memory stays flat however many
+    rows there are.
+    """
+    permission_classes = [IsAuthenticated]
+    # values() path -> column name
+    COLUMNS = {
+        'order_id': 'order_id',
+        'order__created_at': 'ordered_at',
+        'order__status': 'status',
+        'order__buyer_id': 'buyer_id',
+        'order__buyer__username': 'buyer',
+        'order__total_amount': 'order_total',
+        'id': 'item_id',
+        'product_id': 'product_id',
+        'product__title': 'product',
+        'seller_id': 'seller_id',
+        'seller__username': 'seller',
+        'quantity': 'quantity',
+        'price_at_purchase': 'unit_price',
+        'currency': 'currency',
+    }
+
+    def get(self, request):
+        output = request.query_params.get('output', 'csv')
+        if output not in ('csv', 'ndjson'):
+            return Response({"error": "output must be csv or ndjson"}, status=status.HTTP_400_BAD_REQUEST)
+        role = request.query_params.get('role', 'seller')
+        if role == 'seller':
+            items = OrderItem.objects.filter(seller=request.user)
+        elif role == 'buyer':
+            items = OrderItem.objects.filter(order__buyer=request.user)
+        elif role == 'all' and request.user.is_staff:
+            items = OrderItem.objects.all()
+        else:
+            return Response(
+                {"error": "role must be seller or buyer (or all for staff)"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        from_day = parse_day_param(request, 'from')
+        to_day = parse_day_param(request, 'to')
+        if from_day:
+            items = items.filter(order__created_at__date__gte=from_day)
+        if to_day:
+            items = items.filter(order__created_at__date__lte=to_day)
+
+        rows = items.order_by('order_id', 'id').values_list(*self.COLUMNS).iterator(
+            chunk_size=settings.EXPORT_CHUNK_SIZE
+        )
+        if output == 'csv':
+            writer = csv.writer(Echo())
+            lines = itertools.chain(
+                [writer.writerow(self.COLUMNS.values())],
+                # Titles and usernames are user input, opened in spreadsheets
+                (writer.writerow([csv_safe(value) for value in row]) for row in rows)
+            )
+            content_type = 'text/csv'
+        else:
+            encoder = DjangoJSONEncoder()
+            lines = (
+                encoder.encode(dict(zip(self.COLUMNS.values(), row))) + '\n'
+                for row in rows
+            )
+            content_type = 'application/x-ndjson'
+
+        response = StreamingHttpResponse(lines, content_type=content_type)
+        filename = f"orders-{role}-{timezone.localdate():%Y%m%d}.{output}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
 class ProductReviewViewSet(viewsets.ModelViewSet):
     serializer_class = ProductReviewSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     
     def get_queryset(self):
-        product_id = self.kwargs.get('product_pk')
-        if product_id:
-            return ProductReview.objects.filter(product_id=product_id)
+        # Nested under marketplace/products/<slug>/reviews/
+        product_slug = self.kwargs.get('product_slug')
+        if product_slug:
+            return ProductReview.objects.filter(product__slug=product_slug)
         return ProductReview.objects.all()
     
+    # The review and its product's rating aggregates (see signals) change together
+    @transaction.atomic
     def perform_create(self, serializer):
-        product = get_object_or_404(Product, id=self.kwargs.get('product_pk'))
+        product = get_object_or_404(Product, slug=self.kwargs.get('product_slug'))
         serializer.save(reviewer=self.request.user, product=product)
 
+    @transaction.atomic
+    def perform_update(self, serializer):
+        serializer.save()
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+
 class WishlistViewSet(viewsets.ModelViewSet):
     serializer_class = WishlistSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return Wishlist.objects.filter(user=self.request.user)
+        return Wishlist.objects.filter(user=self.request.user).prefetch_related(Prefetch(
+            'products', queryset=ProductSerializer.setup_eager_loading(Product.objects.all())
+        ))
     
     @action(detail=False, methods=['post'])
     def add_product(self, request):
@@ -1697,16 +2566,9 @@ class LiveEventViewSet(viewsets.ModelViewSet):
             )
     
     def perform_create(self, serializer):
-        """Create with automatic thumbnail generation"""
-        youtube_url = serializer.validated_data['youtube_url']
-        video_id = LiveEvent.extract_youtube_id(youtube_url)
-        
-        # Generate thumbnail URL
-        thumbnail = f"https://img.youtube.com/vi/{video_id}/mqdefault.jpg"
-        
+        """Create; the thumbnail is resolved in the background (songs.thumbnails)"""
         serializer.save(
             user=self.request.user,
-            thumbnail=thumbnail,
             is_live=True,
             start_time=timezone.now(),
             viewers_count=0